@@ -2,6 +2,10 @@ from moviemaker3.stacks import *
 from moviemaker3.parameter import *
 from moviemaker3.assignment import *
 from moviemaker3.branch import *
+from moviemaker3.plan import *
+from moviemaker3.precision import *
+from moviemaker3.mesh import *
+from moviemaker3.region import *
 
 __version_tuple__ = (0, 1, 0, 'beta', 1)
 __version_string__ = '0.1.0b1'
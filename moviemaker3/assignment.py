@@ -1,4 +1,5 @@
 from fframework import OpFunction, asfunction
+from moviemaker3.parameter import Lazy
 
 class Assignment(OpFunction):
     """Extends parameter objects by evaluating some Function with the parameter
@@ -10,15 +11,27 @@ class Assignment(OpFunction):
     
         Assignment(p('a'), 1)"""
     
-    def __init__(self, p, value):
-        """*value* is called and stored in the parameter object via *p*."""
+    def __init__(self, p, value, lazy=None):
+        """*value* is called and stored in the parameter object via *p*.
+
+        If *lazy* is true, *value* is called only when the parameter is
+        retrieved for the first time, and not at all if it is never 
+        retrieved.  It is called with the parameter object handed over to
+        the ``Assignment``, as without *lazy*."""
+
+        if lazy is None:
+            lazy = False
 
         self.p = p
         self.value = asfunction(value)
+        self.lazy = lazy
 
     def __call__(self, ps):
         """Extends *ps*."""
 
+        if self.lazy:
+            return self.p.store(ps, value=Lazy(self.value, ps))
+
         value = self.value(ps)
         ps_ext = self.p.store(ps, value=value)
         return ps_ext
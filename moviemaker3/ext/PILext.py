@@ -2,41 +2,139 @@ import numpy
 import PIL.Image
 from fframework import Function
 
+def srgb(linear):
+    """Returns the sRGB encoding of the *linear* values in [0, 1]."""
+
+    linear = numpy.asarray(linear)
+    return numpy.where(linear <= 0.0031308, linear * 12.92,
+        1.055 * linear ** (1 / 2.4) - 0.055)
+
 class PILext(Function):
     """Generates PIL images from numpy ndarrays."""
 
-    def __init__(self, rgbindices=None, aindex=None):
+    def __init__(self, rgbindices=None, aindex=None, premultiplied=None,
+            transfer=None, bits=None, lutsize=None):
         """*rgbindices* should give the indices for ``R, G, B, A`` to take 
         from the array fed to *self.__call__*.  If *rgbindices* is ``None``, 
         then the array will be intereted as grayscale, and *aindex* is 
         ignored.  *aindex* is either ``None`` (alpha channel opaque) or the 
-        index where to take the alpha channel from."""
+        index where to take the alpha channel from.
         
+        If *premultiplied* is true, the colours are premultiplied by the 
+        alpha channel, as the layers of an ``OverStack``, and are converted
+        to straight colours for output.
+
+        *transfer* is the transfer curve applied to the colours, not to 
+        alpha: ``None`` (linear), ``'srgb'``, a gamma value *g* (encoding
+        ``value ** (1 / g)``), or a callable mapping values in [0, 1] to 
+        [0, 1].  *bits* is the output depth, 8 (default) or 16.  If a 
+        *transfer* is given or 16 bits are requested, the transfer and the
+        quantization are done in one step by a lookup table of *lutsize* 
+        entries, indexed by the rounded fixed-point values.  *lutsize* 
+        defaults to 4096 for 8 bits and to 65536 for 16 bits."""
+        
+        if premultiplied is None:
+            premultiplied = False
+        if bits is None:
+            bits = 8
+        if bits not in (8, 16):
+            raise ValueError('Unsupported bit depth: %s' % bits)
+        if lutsize is None:
+            lutsize = {8: 4096, 16: 65536}[bits]
+
         Function.__init__(self)
 
         self.rgbindices = rgbindices
         self.aindex = aindex
+        self.premultiplied = premultiplied
+        self.bits = bits
+        self.dtype = {8: numpy.uint8, 16: numpy.uint16}[bits]
 
-    def __call__(self, layer):
-        """*layer* is supposed to be argb data with the colour index in the
-        first dimension, y in the second and x in the third.
+        self.lut = None
+        self.alphalut = None
+        if transfer is not None or bits != 8:
+            self.lutsize = lutsize
+            self.lut = self.make_lut(transfer)
+            self.alphalut = self.make_lut(None)
+
+    def make_lut(self, transfer):
+        """Returns the lookup table for *transfer*, mapping the fixed-point
+        indices to output values."""
+
+        values = numpy.linspace(0, 1, self.lutsize)
+        if transfer == 'srgb':
+            values = srgb(values)
+        elif callable(transfer):
+            values = numpy.asarray(transfer(values), dtype=numpy.float64)
+        elif transfer is not None:
+            values = values ** (1.0 / transfer)
 
-        Return value is a PIL image.  The input value range is [0, 1]."""
+        maximum = numpy.iinfo(self.dtype).max
+        return numpy.rint(values.clip(0, 1) * maximum).astype(self.dtype)
+
+    def quantize(self, band, lut):
+        """Returns *band* quantized by *lut*.  NaN is quantized as 0."""
+
+        index = numpy.multiply(band, self.lutsize - 1)
+        index[numpy.isnan(index)] = 0
+        index += 0.5
+        index.clip(0, self.lutsize - 1, out=index)
+        return lut.take(index.astype(numpy.intp))
+
+    def into(self, layer, out):
+        """Writes the RGBA data for *layer* into *out*, an uint8 ndarray of
+        shape ``[y, x, 4]`` (uint16 for 16 bits), and returns *out*.  
+        *layer* is as for ``.__call__()``.  *out* may also have 3 channels 
+        (RGB, alpha is dropped), or 1 channel for grayscale data."""
+
+        if out.dtype != self.dtype:
+            raise ValueError('Cannot write %d bit data into %s' % 
+                (self.bits, out.dtype))
+        channels = out.shape[-1]
+        if channels not in (1, 3, 4):
+            raise ValueError('Cannot write into %d channels' % channels)
+        if channels == 1 and self.rgbindices is not None:
+            raise ValueError('Cannot write colour data into 1 channel')
 
         if self.rgbindices is None:
-            ones = numpy.ones_like(layer)
-            image = numpy.asarray([layer, layer, layer, ones])
+            bands = [layer, layer, layer, None]
         else:
+            bands = [layer[index] for index in self.rgbindices]
             if self.aindex is None:
-                alpha = numpy.ones(layer.shape[1:])
+                bands.append(None)
             else:
                 alpha = layer[self.aindex]
-            image = numpy.asarray([layer[index] \
-                for index in self.rgbindices] + [alpha])
+                if self.premultiplied:
+                    bands = [numpy.divide(band, alpha, 
+                            out=numpy.zeros_like(band), where=(alpha > 0))
+                        for band in bands]
+                bands.append(alpha)
+
+        for (index, band) in enumerate(bands[:channels]):
+            if band is None:
+                # Opaque.
+                out[..., index] = numpy.iinfo(self.dtype).max
+            elif self.lut is not None:
+                if index < 3:
+                    out[..., index] = self.quantize(band, self.lut)
+                else:
+                    out[..., index] = self.quantize(band, self.alphalut)
+            else:
+                # value in [0, 1], truncated on assignment:
+                out[..., index] = band.clip(0, 1) * 255
+        return out
+
+    def __call__(self, layer):
+        """*layer* is supposed to be argb data with the colour index in the
+        first dimension, y in the second and x in the third.
 
-        # [band, y, x] -> [y, x, band]:
-        image = numpy.rollaxis(image, 0, 3)
-        # value in [0, 1]:
-        image = image.clip(0, 1)
+        Return value is a PIL image.  The input value range is [0, 1].  The
+        conversion is done in the dtype of *layer*.  PIL has no 16 bit RGBA
+        images, so for 16 bits the uint16 ndarray of shape ``[y, x, 4]`` is 
+        returned instead.  ``Render`` saves them as described there."""
 
-        return PIL.Image.fromarray((image * 255).astype(numpy.uint8))
+        out = numpy.empty(layer.shape[-2:] + (4,), dtype=self.dtype)
+        self.into(layer, out)
+        if self.bits == 16:
+            return out
+        return PIL.Image.fromarray(out)
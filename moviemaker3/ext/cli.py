@@ -0,0 +1,274 @@
+"""Provides the command line interface for rendering, suited for splitting
+a render job into shards for several machines::
+
+    python -m moviemaker3.ext.cli render scenes.intro:make 25 out/ \\
+        --start 0 --stop 999 --shard 3/8 --backend processes --jobs 4
+    python -m moviemaker3.ext.cli merge out/
+
+The scene factory ``module:callable`` is called without arguments and
+returns either the supplier of PIL images or a ``Render``.  Each shard
+writes a manifest listing the frames of the job and its rendered frames.
+``merge`` checks the manifests for completeness."""
+
+import os
+import sys
+import glob
+import json
+import Queue
+import argparse
+import importlib
+import threading
+import multiprocessing
+import numpy
+from moviemaker3.ext.render import Render
+
+__all__ = ['main']
+
+def load(factory):
+    """Imports the scene factory *factory*, given as ``module:callable``,
+    calls it, and returns the ``Render`` for the result."""
+
+    (modulename, name) = factory.split(':')
+    if os.getcwd() not in sys.path:
+        sys.path.insert(0, os.getcwd())
+    module = importlib.import_module(modulename)
+    scene = getattr(module, name)()
+    if isinstance(scene, Render):
+        return scene
+    return Render(scene)
+
+def parse_frames(specification):
+    """Returns the sorted list of frametimes given by *specification*, a
+    comma-separated list of frametimes and inclusive ranges, e.g.
+    ``'0-99,150,200-210'``."""
+
+    frametimes = set()
+    for item in specification.split(','):
+        if '-' in item[1:]:
+            (start, stop) = item[1:].split('-', 1)
+            start = item[0] + start
+            frametimes.update(range(int(start), int(stop) + 1))
+        else:
+            frametimes.add(int(item))
+    return sorted(frametimes)
+
+def shard(frametimes, index, count):
+    """Returns the contiguous part *index* of *count* parts of
+    *frametimes*.  The sizes of the parts differ by at most one."""
+
+    return frametimes[index * len(frametimes) // count:
+        (index + 1) * len(frametimes) // count]
+
+def manifest_path(directory, prefix, index, count):
+    """Returns the path of the manifest of shard *index* of *count*."""
+
+    return os.path.join(directory,
+        '%smanifest-%03d-of-%03d.json' % (prefix, index, count))
+
+def _render(factory, frametimes, options):
+    """Renders *frametimes* with the scene of *factory* and the keyword
+    arguments *options* for ``Render``, and returns the list of the
+    frametimes rendered without error.  The capsules are consumed while
+    rendering, so that the images are not held until the end.  An 
+    exception raised by ``Render`` is raised again."""
+
+    renderer = load(factory)
+    render_queue = Queue.Queue()
+
+    def run():
+        # Posts None when done, or the exception.
+        try:
+            renderer(frametimes=frametimes, render_queue=render_queue,
+                wait=True, startframetime=frametimes[0],
+                stopframetime=frametimes[-1], **options)
+            render_queue.put(None)
+        except:
+            render_queue.put(sys.exc_info())
+
+    thread = threading.Thread(target=run)
+    thread.start()
+
+    rendered = []
+    try:
+        while True:
+            capsule = render_queue.get()
+            if capsule is None:
+                break
+            if isinstance(capsule, tuple):
+                raise capsule[0], capsule[1], capsule[2]
+            if getattr(capsule, 'frameindex', None) is None:
+                continue
+            if not capsule.error:
+                rendered.append(frametimes[0] + capsule.frameindex)
+            capsule.release()
+    finally:
+        thread.join()
+    return rendered
+
+def _render_star(arguments):
+    """Calls ``_render(*arguments)``, for ``multiprocessing.Pool.map()``."""
+
+    return _render(*arguments)
+
+def render(arguments):
+    """Renders the shard of the job given by the parsed *arguments*, and
+    writes its manifest.  Returns the exit code."""
+
+    if arguments.frames is not None:
+        job = parse_frames(arguments.frames)
+    else:
+        job = range(arguments.start, arguments.stop + 1, arguments.step)
+    (index, count) = [int(item) for item in arguments.shard.split('/')]
+    if not 0 <= index < count:
+        raise ValueError('Shard index must be in [0, %d)' % count)
+    frametimes = shard(job, index, count)
+
+    if not os.path.isdir(arguments.directory):
+        os.makedirs(arguments.directory)
+
+    options = dict(framerate=arguments.framerate,
+        directory=arguments.directory,
+        extension=arguments.extension,
+        prefix=arguments.prefix,
+        subframes=arguments.subframes,
+        shutter=arguments.shutter,
+        tabulate_time=arguments.tabulate_time)
+    if arguments.dtype is not None:
+        options['dtype'] = numpy.dtype(arguments.dtype)
+
+    rendered = []
+    if len(frametimes) > 0:
+        if arguments.backend == 'threads':
+            rendered = _render(arguments.factory, frametimes,
+                dict(options, nthreads=arguments.jobs))
+        else:
+            parts = [shard(frametimes, part, arguments.jobs)
+                for part in xrange(0, arguments.jobs)]
+            parts = [part for part in parts if len(part) > 0]
+            pool = multiprocessing.Pool(len(parts))
+            try:
+                for result in pool.map(_render_star, [(arguments.factory,
+                        part, dict(options, nthreads=1)) for part in parts]):
+                    rendered.extend(result)
+            finally:
+                pool.close()
+                pool.join()
+
+    rendered = sorted(rendered)
+    template = '%s%%06d.%s' % (arguments.prefix, arguments.extension)
+    manifest = dict(
+        job=job,
+        shard=[index, count],
+        frames=dict([(str(frametime), template % frametime)
+            for frametime in rendered]),
+        failed=sorted(set(frametimes) - set(rendered)))
+    stream = open(manifest_path(arguments.directory, arguments.prefix,
+        index, count), 'w')
+    try:
+        json.dump(manifest, stream, indent=1, sort_keys=True)
+    finally:
+        stream.close()
+
+    if manifest['failed']:
+        print "Failed frames:", manifest['failed']
+        return 1
+    return 0
+
+def merge(arguments):
+    """Checks the manifests in the directory given by the parsed
+    *arguments* for completeness of the job.  Returns the exit code."""
+
+    paths = sorted(glob.glob(os.path.join(arguments.directory,
+        '%smanifest-*-of-*.json' % arguments.prefix)))
+    if len(paths) == 0:
+        print "No manifests found."
+        return 1
+
+    manifests = []
+    for path in paths:
+        stream = open(path)
+        try:
+            manifests.append(json.load(stream))
+        finally:
+            stream.close()
+
+    problems = []
+    job = manifests[0]['job']
+    count = manifests[0]['shard'][1]
+    if any([manifest['job'] != job or manifest['shard'][1] != count
+            for manifest in manifests]):
+        problems.append('The manifests belong to different jobs.')
+    missing_shards = set(xrange(0, count)) - \
+        set([manifest['shard'][0] for manifest in manifests])
+    if missing_shards:
+        problems.append('Missing shards: %s' % sorted(missing_shards))
+
+    files = {}
+    for manifest in manifests:
+        for (frametime, filename) in manifest['frames'].items():
+            files[int(frametime)] = filename
+    missing = [frametime for frametime in job if frametime not in files]
+    if missing:
+        problems.append('Missing frames: %s' % missing)
+    absent = [frametime for (frametime, filename) in sorted(files.items())
+        if not os.path.isfile(os.path.join(arguments.directory, filename))]
+    if absent:
+        problems.append('Missing files of frames: %s' % absent)
+
+    for problem in problems:
+        print problem
+    if problems:
+        return 1
+    print "Complete: %d frames in %d shards." % (len(job), count)
+    return 0
+
+def main(argv=None):
+    """Runs the command line interface with *argv*, defaulting to
+    ``sys.argv[1:]``.  Returns the exit code."""
+
+    parser = argparse.ArgumentParser(prog='mm3-render',
+        description='Renders moviemaker3 scenes.')
+    subparsers = parser.add_subparsers()
+
+    render_parser = subparsers.add_parser('render',
+        help='render a shard of a job')
+    render_parser.set_defaults(command=render)
+    render_parser.add_argument('factory',
+        help='scene factory as module:callable')
+    render_parser.add_argument('framerate', type=float)
+    render_parser.add_argument('directory')
+    render_parser.add_argument('--start', type=int, default=0,
+        help='first frametime of the job')
+    render_parser.add_argument('--stop', type=int,
+        help='last frametime of the job, inclusive, required unless '
+            '--frames is given')
+    render_parser.add_argument('--step', type=int, default=1)
+    render_parser.add_argument('--frames',
+        help='explicit frametimes of the job, e.g. 0-99,150')
+    render_parser.add_argument('--shard', default='0/1',
+        help='k/n renders the k-th (from 0) of n contiguous parts')
+    render_parser.add_argument('--backend', default='threads',
+        choices=['threads', 'processes'])
+    render_parser.add_argument('--jobs', type=int, default=1,
+        help='number of threads or processes')
+    render_parser.add_argument('--prefix', default='')
+    render_parser.add_argument('--extension', default='png')
+    render_parser.add_argument('--subframes', type=int)
+    render_parser.add_argument('--shutter', type=float)
+    render_parser.add_argument('--tabulate-time', action='store_true')
+    render_parser.add_argument('--dtype', help='e.g. float32')
+
+    merge_parser = subparsers.add_parser('merge',
+        help='check the shard manifests for completeness')
+    merge_parser.set_defaults(command=merge)
+    merge_parser.add_argument('directory')
+    merge_parser.add_argument('--prefix', default='')
+
+    arguments = parser.parse_args(argv)
+    if arguments.command is render and arguments.frames is None and \
+            arguments.stop is None:
+        render_parser.error('--stop is required unless --frames is given')
+    return arguments.command(arguments)
+
+if __name__ == '__main__':
+    sys.exit(main())
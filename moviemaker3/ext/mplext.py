@@ -1,5 +1,10 @@
+import threading
+import collections
+import numpy
+import PIL.Image
+import matplotlib.backends.backend_agg
 import matplotlayers.backends.PIL
-from fframework import OpFunction
+from fframework import OpFunction, asfunction
 
 class Mpl2PIL(OpFunction):
     """Generates PIL images from a matplotlib Figure."""
@@ -21,3 +26,116 @@ class Mpl2PIL(OpFunction):
 
         image = self.backend.output_PIL(shape)
         return image
+
+class CachedMpl2PIL(OpFunction):
+    """Generates PIL images from matplotlib Figures, and can be used from
+    several threads at the same time.
+
+    Each thread creates its own Figure.  The static parts of the Figure are
+    rendered once per thread and shape, and on each call only the animated
+    artists are drawn on top of that background (blitting).  The images can
+    be cached by the Figure state they show."""
+
+    def __init__(self, factory, shape, update=None, state=None, 
+            cachesize=None):
+        """*factory* is called without arguments once in each thread, and 
+        returns ``(figure, artists)``, a new 
+        :class:`matplotlib.figure.Figure` and the list of its animated 
+        artists.  Only those artists may change between calls.  *update* 
+        is called as ``update(figure, artists, ps)`` to set up the animated 
+        artists for *ps*, it defaults to doing nothing.
+
+        *shape* is the shape ``(shapey, shapex)`` of the resulting image
+        in pixels.  It is a :class:`moviemaker3.p`.
+
+        *state* is a Function returning a hashable description of the Figure
+        state to render.  If it is given, the last *cachesize* (default 16)
+        images are cached by ``(shape, state)``.  Cached images are shared,
+        so they must not be modified."""
+
+        if cachesize is None:
+            cachesize = 16
+
+        self.factory = factory
+        self.update = update
+        self.shape = shape
+        if state is None:
+            self.state = None
+        else:
+            self.state = asfunction(state)
+        self.cachesize = cachesize
+
+        self._local = threading.local()
+        self._cache = collections.OrderedDict()
+        self._cache_lock = threading.Lock()
+
+    def _canvas(self, shape):
+        """Returns the canvas of the calling thread, set up with the 
+        background for *shape*."""
+
+        local = self._local
+        if getattr(local, 'canvas', None) is None:
+            (local.figure, local.artists) = self.factory()
+            for artist in local.artists:
+                artist.set_animated(True)
+            local.canvas = matplotlib.backends.backend_agg.FigureCanvasAgg(
+                local.figure)
+            local.shape = None
+
+        if local.shape != shape:
+            (shapey, shapex) = shape
+            dpi = float(local.figure.get_dpi())
+            # The canvas truncates the size in pixels, a quarter pixel 
+            # margin avoids losing a pixel by rounding errors:
+            local.figure.set_size_inches((shapex + 0.25) / dpi, 
+                (shapey + 0.25) / dpi)
+            if local.canvas.get_width_height() != (shapex, shapey):
+                raise ValueError('Cannot set up a canvas of shape %s, got '
+                    '%s (width, height)' % (shape, 
+                    local.canvas.get_width_height()))
+            # Draws everything except the animated artists:
+            local.canvas.draw()
+            local.background = local.canvas.copy_from_bbox(
+                local.figure.bbox)
+            local.shape = shape
+
+        return local.canvas
+
+    def _render(self, shape, ps):
+        """Renders the Figure of the calling thread for *ps*."""
+
+        local = self._local
+        canvas = self._canvas(shape)
+
+        canvas.restore_region(local.background)
+        if self.update is not None:
+            self.update(local.figure, local.artists, ps)
+        for artist in local.artists:
+            local.figure.draw_artist(artist)
+
+        (width, height) = canvas.get_width_height()
+        rgba = numpy.frombuffer(canvas.buffer_rgba(), dtype=numpy.uint8)
+        # The buffer is reused by the canvas, so copy it:
+        return PIL.Image.fromarray(rgba.reshape((height, width, 4)).copy())
+
+    def __call__(self, ps):
+        """Renders the figure, or returns the cached image."""
+
+        shape = tuple(self.shape(ps))
+        if self.state is None:
+            return self._render(shape, ps)
+
+        key = (shape, self.state(ps))
+        with self._cache_lock:
+            if key in self._cache:
+                image = self._cache.pop(key)
+                self._cache[key] = image
+                return image
+
+        image = self._render(shape, ps)
+
+        with self._cache_lock:
+            self._cache[key] = image
+            while len(self._cache) > self.cachesize:
+                self._cache.popitem(last=False)
+        return image
@@ -1,18 +1,48 @@
+import numpy
 from fframework import OpFunction, asfunction
 from moviemaker3.assignment import Assignment
 
 class Multid(OpFunction):
 
-    def __init__(self, target, stack, values, p):
+    def __init__(self, target, stack, values, p,
+            batched=None, chunksize=None, expand=None):
         """*values* is an iterable.  There will be as many layers superimposed 
         as there are items in *values*.  *p* is used to store the values from
         *values*.  
         
         Each value is stored by an Extension using *p*, and the result is fed
         to the *target*.  The stack will contain elements for each such
-        combination."""
+        combination.
+
+        If *batched* is true, the *values* are instead stacked into one array
+        along a new leading axis, and the stack is left unchanged.  On call,
+        the *values* are stored in chunks of at most *chunksize* (default 64)
+        values, and *target* is evaluated once per chunk.  *target* must then
+        return the results for all values of the chunk along the leading 
+        axis, which are reduced by the stack's ``.combine_batch()``.  The
+        elements already in the stack are combined below the *values*.
+        *expand* singleton axes (default 0) are inserted after the leading 
+        axis of the stored values, so that e.g. vector values broadcast 
+        against a mesh."""
+
+        if batched is None:
+            batched = False
+        if chunksize is None:
+            chunksize = 64
+        if expand is None:
+            expand = 0
 
         self.stack = stack
+        self.batched = batched
+
+        if batched:
+            self.target = asfunction(target)
+            self.p = p
+            self.chunksize = chunksize
+            values = numpy.asarray(list(values))
+            self.values = values.reshape(values.shape[:1] + (1,) * expand +
+                values.shape[1:])
+            return
         
         for value in values:
             # Feed the extension result to the target:
@@ -22,4 +52,15 @@ class Multid(OpFunction):
 
     def __call__(self, ps):
         
-        return self.stack(ps)
+        if not self.batched:
+            return self.stack(ps)
+
+        stack = self.stack
+        accumulator = stack.start(ps)
+        for layer in stack.elements:
+            accumulator = stack.combine(accumulator, layer(ps))
+        for start in xrange(0, len(self.values), self.chunksize):
+            chunk = self.values[start:start + self.chunksize]
+            results = self.target(self.p.store(ps, value=chunk))
+            accumulator = stack.combine_batch(accumulator, results)
+        return stack.finish(accumulator)
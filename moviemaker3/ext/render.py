@@ -1,10 +1,20 @@
+import sys
 import Queue
+import functools
+import time
 import threading
+import multiprocessing.pool
 import traceback
 import os.path
 import logging
 import numpy
+import PIL.Image
 from moviemaker3.parameter import p, Ps
+from moviemaker3.precision import dtypeline
+from moviemaker3.timeline import tabulate
+from moviemaker3.plan import cache_static
+from moviemaker3.region import regionline, union
+from moviemaker3.stacks.parallel import pooled
 import moviemaker3.ext.render_capsules
 
 """Provides a multithreaded rendering engine."""
@@ -17,18 +27,25 @@ class Render:
     """Runs the rendering.  Initially supported timelines are ``'realtime'`` 
     and ``'frametime'``."""
 
-    def __init__(self, fn):
+    def __init__(self, fn, convert=None):
         """
         *   *fn* is the supplier of PIL images.
+        *   If *convert* is given, *fn* supplies layers, and *convert* turns
+            them into PIL images, e.g. a ``PILext``.  This way, subframes 
+            are averaged before quantisation.
         """
 
         self.fn = fn
+        self.convert = convert
 
     def __call__(self, framerate,
             directory, extension=None, prefix=None, nthreads=None,
             startrealtime=None, stoprealtime=None,
             startframetime=None, stopframetime=None,
-            render_queue=None, framestep=None):
+            render_queue=None, framestep=None, dtype=None,
+            tabulate_time=None, subframes=None, shutter=None,
+            dirty=None, verify=None, frametimes=None, wait=None,
+            ring=None, telemetry=None):
         """
         *   *framerate* is fps.
         *   *directory* is the output directory, *extension* the filename
@@ -41,6 +58,50 @@ class Render:
         *   *args* and *kwargs* are handed over to the Layer this
             ``BoundRenderLayer`` was bound to upon initialisation time.
         *   During rendering, the frametime is stepped with *framestep*.
+        *   *dtype* is stored as the ``'dtype'`` parameter, the floating 
+            point dtype to compute in, e.g. ``numpy.float32``.  By default,
+            no dtype is demanded.
+        *   If *tabulate_time* is true, the scalar subgraphs depending only
+            on the time are evaluated for all frames at once before 
+            rendering, see :func:`moviemaker3.timeline.tabulate`.
+        *   Each frame is the average of *subframes* (default 1) frames 
+            equally spaced in time, centered on the frame, and spanning
+            *shutter* (default 1) times the frame interval (motion blur).
+            The subframes are summed up in one floating point buffer.  
+            With several subframes, the static subgraphs are evaluated only
+            once, and the subgraphs not depending on the real time once per
+            frame, see :func:`moviemaker3.plan.cache_static`.
+        *   If *dirty* is given, rendering is incremental.  Each thread 
+            renders a contiguous range of frames in order.  The first frame
+            is rendered fully.  For the following frames, *dirty* is called
+            with the parameters of the frame.  It returns the region ``(y0,
+            y1, x0, x1)`` changed since the previous frame, a list of such
+            regions, or None for the whole frame.  Only the bounding box of
+            the regions is re-evaluated, with the ``'region'`` parameter set,
+            and pasted into the previous image.  The Function must honour 
+            the region, see :mod:`moviemaker3.region`.  If *verify* is true,
+            each incremental frame is compared with a full rendering, and 
+            the frame fails if they differ.
+        *   *frametimes* is an explicit list of frametimes to render.  It
+            replaces the frames given by the times and *framestep*.  The 
+            start and stop frametimes default to its minimum and maximum.
+        *   If *wait* is true, returns only after all frames have been 
+            rendered.
+        *   If a ``FrameRing`` *ring* is given, each frame is written into a
+            slot of it, and the frame file is saved from there.  The 
+            capsules put into *render_queue* then refer to the slot, and the
+            receiver must release them.  If *convert* has an ``.into()``
+            method, like ``PILext``, the layers are converted right into the
+            slots, except for incremental rendering.  The ring holds 8 bit
+            frames only.
+        *   16 bit frames, given as uint16 ndarrays ``[y, x, channels]``, 
+            e.g. by ``PILext(bits=16)``, are saved as NumPy files if 
+            *extension* is ``'npy'``, else as one 16 bit grayscale image 
+            per channel, with ``-r``, ``-g``, ``-b`` and ``-a`` appended to 
+            the filename before the extension.
+        *   The timings of each frame are attached to its capsule as 
+            ``.timing``.  If a ``Telemetry`` *telemetry* is given, they are
+            recorded there too, see :mod:`moviemaker3.ext.telemetry`.
 
         Renders to HDD and puts ImageCapsules into *render_queue* if
         given.
@@ -48,18 +109,33 @@ class Render:
 
         if extension is None:
             extension = 'png'
+        if ring is not None and getattr(self.convert, 'bits', 8) != 8:
+            raise ValueError('A FrameRing holds 8 bit frames only')
         if prefix is None:
             prefix = ''
         if nthreads is None:
             nthreads = 1
         if framestep is None:
             framestep = 1
+        if tabulate_time is None:
+            tabulate_time = False
+        if subframes is None:
+            subframes = 1
+        if shutter is None:
+            shutter = 1.0
         
         file_template = os.path.join(directory, 
             '%s%%06d.%s' % (prefix, extension))
 
         # Get the duration to render ...
 
+        if frametimes is not None:
+            frametimes = sorted(frametimes)
+            if startframetime is None and startrealtime is None:
+                startframetime = frametimes[0]
+            if stopframetime is None and stoprealtime is None:
+                stopframetime = frametimes[-1]
+
         if startrealtime is not None:
             startframetime = int(startrealtime * framerate)
         if stoprealtime is not None:
@@ -70,8 +146,6 @@ class Render:
         if stopframetime is not None:
             stopframetime = int(stopframetime)
 
-        nframes = stopframetime - startframetime + 1
-
         # It is intentional that the stored times may deviate from the 
         # times handed over, because they represent the times of frames.
         startrealtime = startframetime / float(framerate)
@@ -79,68 +153,443 @@ class Render:
 
         # Initialise the queue ...
 
+        # The queue holds chunks of frametimes, each rendered in order by 
+        # one thread.
         queue = Queue.Queue()
 
-        for frametime in xrange(startframetime, stopframetime + 1, 
-                framestep):
-            queue.put(frametime)
+        if frametimes is None:
+            frametimes = range(startframetime, stopframetime + 1, framestep)
+        if dirty is None:
+            chunks = [[frametime] for frametime in frametimes]
+        else:
+            chunksize = max(1, -(-len(frametimes) // nthreads))
+            chunks = [frametimes[start:start + chunksize]
+                for start in xrange(0, len(frametimes), chunksize)]
+        enqueued = time.time()
+        for chunk in chunks:
+            queue.put((enqueued, chunk))
+
+        # Prepare the Function ...
+
+        fn = self._prepare(frametimes, framerate, dtype, subframes, shutter,
+            tabulate_time)
 
         # Announce the render ...
 
+        if telemetry is not None:
+            telemetry.start(nframes=len(frametimes))
+
         if render_queue is not None:
             render_queue.put(moviemaker3.ext.render_capsules.AnnounceCapsule(
-                nframes=nframes))
+                nframes=len(frametimes),
+                frameindices=[frametime - startframetime 
+                    for frametime in frametimes]))
 
         # Start the render ...
 
+        threads = []
         for threadindex in xrange(0, nthreads):
-            thread = threading.Thread(target=self._render,
-                kwargs=dict(queue=queue,
+            thread = threading.Thread(name=('render-%d' % threadindex),
+                target=self._render,
+                kwargs=dict(fn=fn,
+                            queue=queue,
                             render_queue=render_queue,
                             framerate=framerate,
                             file_template=file_template,
-                            startframetime=startframetime))
+                            startframetime=startframetime,
+                            dtype=dtype,
+                            subframes=subframes,
+                            shutter=shutter,
+                            dirty=dirty,
+                            verify=verify,
+                            ring=ring,
+                            telemetry=telemetry))
             thread.setDaemon(True)
             thread.start()
+            threads.append(thread)
+
+        if wait:
+            for thread in threads:
+                thread.join()
+
+    def frames(self, framerate, startframetime=None, stopframetime=None,
+            framestep=None, frametimes=None, nthreads=None, pool=None,
+            maxpending=None, dtype=None, tabulate_time=None, 
+            subframes=None, shutter=None, convert=None):
+        """Renders the frames and yields ``(frameindex, image)`` in the 
+        order the frames complete, without saving them.  The frameindex 
+        starts with 0 at *startframetime*.
+        
+        *   The frames are given by *startframetime*, *stopframetime* 
+            (inclusive) and *framestep*, or by the list *frametimes*.
+        *   *nthreads* (default 1) workers evaluate the frames.  They run 
+            in the ``multiprocessing.pool.ThreadPool`` *pool* if given, 
+            else in a pool of *nthreads* threads held during the render.
+            In *pool*, the workers are marked as pool threads, so that the
+            stacks evaluate serially there; *pool* may be the 
+            ``shared_pool()`` of the stacks.
+        *   At most *maxpending* (default 2 * *nthreads*) completed frames
+            wait for the consumer.  When the consumer is slower, the 
+            workers block.
+        *   *dtype*, *tabulate_time*, *subframes* and *shutter* are as for
+            ``.__call__()``.  If *convert* is False, the layers are yielded
+            before applying ``.convert``.
+        
+        Closing the generator cancels the render; the frames being 
+        evaluated are finished and discarded.  An exception in a frame 
+        cancels the render and is raised to the consumer."""
+
+        if nthreads is None:
+            nthreads = 1
+        if maxpending is None:
+            maxpending = 2 * nthreads
+        if framestep is None:
+            framestep = 1
+        if tabulate_time is None:
+            tabulate_time = False
+        if subframes is None:
+            subframes = 1
+        if shutter is None:
+            shutter = 1.0
 
-    def _render(self, queue, framerate, file_template, startframetime,
-            render_queue=None):
-        """*render_queue* is optional."""
+        if frametimes is None:
+            frametimes = range(startframetime, stopframetime + 1, framestep)
+        else:
+            frametimes = sorted(frametimes)
+        if startframetime is None:
+            startframetime = frametimes[0]
+
+        fn = self._prepare(frametimes, framerate, dtype, subframes, shutter,
+            tabulate_time)
+
+        queue = Queue.Queue()
+        for frametime in frametimes:
+            queue.put(frametime)
+        # The bounded queue of the results provides the backpressure.
+        results = Queue.Queue(maxsize=maxpending)
+        cancelled = threading.Event()
+
+        own_pool = (pool is None)
+        if own_pool:
+            pool = multiprocessing.pool.ThreadPool(nthreads)
+        worker = functools.partial(self._produce, fn=fn, queue=queue,
+            results=results, cancelled=cancelled, framerate=framerate,
+            dtype=dtype, subframes=subframes, shutter=shutter,
+            convert=convert)
+        if not own_pool:
+            # Stacks waiting for tasks in the same pool would deadlock it.
+            worker = functools.partial(pooled, worker)
+        for index in xrange(0, nthreads):
+            pool.apply_async(worker)
+
+        # Each worker puts None when it stops.
+        nrunning = nthreads
+        try:
+            while nrunning > 0:
+                result = results.get()
+                if result is None:
+                    nrunning -= 1
+                    continue
+                (frametime, image, exc_info) = result
+                if exc_info is not None:
+                    raise exc_info[0], exc_info[1], exc_info[2]
+                yield (frametime - startframetime, image)
+        finally:
+            cancelled.set()
+            # Unblock the workers still putting results.
+            while nrunning > 0:
+                if results.get() is None:
+                    nrunning -= 1
+            if own_pool:
+                pool.close()
+                pool.join()
+
+    def _produce(self, fn, queue, results, cancelled, framerate, dtype=None,
+            subframes=None, shutter=None, convert=None):
+        """Evaluates the frametimes from *queue* with *fn* and puts 
+        ``(frametime, image, exc_info)`` into *results*, until *queue* is 
+        empty or *cancelled* is set.  Puts None when done."""
 
         frametimeline = p('time/frame')
+
+        try:
+            while not cancelled.is_set():
+                try:
+                    frametime = queue.get(block=False)
+                except Queue.Empty:
+                    break
+                try:
+                    ps = frametimeline.store(Ps(), frametime)
+                    if dtype is not None:
+                        ps = dtypeline.store(ps, dtype)
+                    realtimes = self.subframe_times(frametime, framerate,
+                        subframes, shutter)
+                    image = self._evaluate(fn, ps, realtimes, dtype=dtype,
+                        convert=convert)
+                    results.put((frametime, image, None))
+                except:
+                    cancelled.set()
+                    results.put((frametime, None, sys.exc_info()))
+        finally:
+            results.put(None)
+
+    def _prepare(self, frametimes, framerate, dtype, subframes, shutter,
+            tabulate_time):
+        """Returns the Function to render *frametimes* with, see 
+        ``.__call__()``."""
+
+        fn = self.fn
+        if subframes > 1:
+            fn = cache_static(fn)
+        if tabulate_time:
+            keys = [(frametime, realtime) for frametime in frametimes
+                for realtime in self.subframe_times(frametime, framerate,
+                    subframes, shutter)]
+            fn = tabulate(fn, [frametime for (frametime, realtime) in keys],
+                framerate, dtype=dtype,
+                realtimes=[realtime for (frametime, realtime) in keys])
+        return fn
+
+    def subframe_times(self, frametime, framerate, subframes, shutter):
+        """Returns the list of the real times of the *subframes* subframes
+        of frame *frametime*.  A single subframe is at the time of the frame
+        itself."""
+
+        if subframes == 1:
+            return [float(frametime) / framerate]
+        return [(frametime + shutter * ((index + 0.5) / subframes - 0.5)) /
+            float(framerate) for index in xrange(0, subframes)]
+
+    def _evaluate(self, fn, ps, realtimes, dtype=None, convert=None):
+        """Evaluates *fn* with *ps* at all *realtimes*, and returns the PIL 
+        image of the average.  The average is computed in *dtype*, which 
+        defaults to float64.  If *convert* is False, the average is returned
+        before applying ``.convert``."""
+
+        if convert is None:
+            convert = True
+        if not convert or self.convert is None:
+            convert = None
+        else:
+            convert = self.convert
+
         realtimeline = p('time/real')
 
+        if len(realtimes) == 1:
+            result = fn(realtimeline.store(ps, realtimes[0]))
+            if convert is not None:
+                result = convert(result)
+            return result
+
+        if dtype is None:
+            dtype = numpy.float64
+
+        buffer = None
+        for realtime in realtimes:
+            result = fn(realtimeline.store(ps, realtime))
+            if buffer is None:
+                mode = getattr(result, 'mode', None)
+                buffer = numpy.array(result, dtype=dtype)
+            else:
+                buffer += numpy.asarray(result)
+        buffer /= len(realtimes)
+
+        if convert is not None:
+            return convert(buffer)
+        if self.convert is not None:
+            return buffer
+        # Averaged PIL images, round to the nearest integer:
+        buffer += 0.5
+        return PIL.Image.fromarray(buffer.astype(numpy.uint8), mode)
+
+    def _update(self, fn, ps, realtimes, previous, rectangles, dtype=None):
+        """Returns the PIL image *previous* with the bounding box of 
+        *rectangles* re-evaluated.  *rectangles* is a region ``(y0, y1, x0,
+        x1)``, a list of regions, or None for the whole frame."""
+
+        if rectangles is None:
+            return self._evaluate(fn, ps, realtimes, dtype=dtype)
+        if len(rectangles) > 0 and numpy.ndim(rectangles) == 1:
+            rectangles = [rectangles]
+
+        if isinstance(previous, numpy.ndarray):
+            (height, width) = previous.shape[:2]
+        else:
+            (width, height) = previous.size
+        region = union(rectangles, (height, width))
+        if region is None:
+            # Nothing changed.
+            return previous
+
+        (y0, y1, x0, x1) = region
+        patch = self._evaluate(fn, regionline.store(ps, region), realtimes,
+            dtype=dtype)
+        if not isinstance(previous, numpy.ndarray) and \
+                patch.mode != previous.mode:
+            # E.g. the previous frame was converted for a FrameRing.
+            patch = patch.convert(previous.mode)
+        pixels = numpy.array(previous)
+        pixels[y0:y1, x0:x1] = numpy.asarray(patch)
+        if isinstance(previous, numpy.ndarray):
+            return pixels
+        return PIL.Image.fromarray(pixels, previous.mode)
+
+    def _save(self, image, filename):
+        """Saves the frame *image*, a PIL image or a 16 bit ndarray, to
+        *filename*, see ``.__call__()``."""
+
+        if not isinstance(image, numpy.ndarray):
+            image.save(filename)
+            return
+        if filename.endswith('.npy'):
+            numpy.save(filename, image)
+            return
+        (root, extension) = os.path.splitext(filename)
+        for (index, band) in enumerate('rgba'[:image.shape[-1]]):
+            PIL.Image.fromarray(numpy.ascontiguousarray(image[..., index])
+                ).save('%s-%s%s' % (root, band, extension))
+
+    def _render_frame(self, fn, frametime, framerate, file_template, 
+            startframetime, previous=None, render_queue=None, dtype=None,
+            subframes=None, shutter=None, dirty=None, verify=None,
+            ring=None, queued=None, telemetry=None):
+        """Renders and saves the frame *frametime*.  If *dirty* and the 
+        image of the *previous* frame are given, only the dirty region is 
+        re-evaluated.  With a *ring*, the frame is passed on in a slot of
+        it.  *queued* is the time the frame waited in the queue, the timing
+        record is handed to *telemetry*, if given.  Returns the image, or 
+        None on error."""
+
+        if queued is None:
+            queued = 0.0
+
+        frametimeline = p('time/frame')
+        realtimeline = p('time/real')
+
+        realtime = float(frametime) / framerate
+        logger.info('Rendering frame %d at %f' % (frametime, realtime))
+        slot = None
+        timing = dict(frametime=frametime,
+            worker=threading.current_thread().getName(),
+            queued=queued, evaluation=None, save=None, error=False)
+        started = time.time()
+        try:
+            ps = Ps()
+            ps = frametimeline.store(ps, frametime)
+            if dtype is not None:
+                ps = dtypeline.store(ps, dtype)
+            realtimes = self.subframe_times(frametime, framerate, subframes,
+                shutter)
+
+            if ring is not None and dirty is None and \
+                    hasattr(self.convert, 'into'):
+                # Convert right into the slot.
+                layer = self._evaluate(fn, ps, realtimes, dtype=dtype,
+                    convert=False)
+                timing['evaluation'] = time.time() - started
+                slot = ring.acquire()
+                self.convert.into(layer, ring.view(slot))
+                image = ring.image(slot)
+            elif dirty is None or previous is None:
+                image = self._evaluate(fn, ps, realtimes, dtype=dtype,
+                    convert=False)
+                timing['evaluation'] = time.time() - started
+                if self.convert is not None:
+                    image = self.convert(image)
+            else:
+                rectangles = dirty(realtimeline.store(ps, realtime))
+                image = self._update(fn, ps, realtimes, previous, 
+                    rectangles, dtype=dtype)
+                if verify:
+                    full = self._evaluate(fn, ps, realtimes, dtype=dtype)
+                    if not numpy.array_equal(numpy.asarray(image),
+                            numpy.asarray(full)):
+                        raise ValueError('Incremental rendering of frame %d '
+                            'differs from full rendering' % frametime)
+                timing['evaluation'] = time.time() - started
+
+            if ring is not None and slot is None:
+                mode = ring.modes[ring.shape[-1]]
+                if getattr(image, 'mode', mode) != mode:
+                    image = image.convert(mode)
+                slot = ring.acquire()
+                pixels = numpy.asarray(image)
+                if pixels.dtype != numpy.uint8:
+                    raise ValueError('A FrameRing holds 8 bit frames only')
+                ring.view(slot)[...] = pixels.reshape(ring.shape)
+
+            if slot is None:
+                self._save(image, file_template % frametime)
+            else:
+                ring.image(slot).save(file_template % frametime)
+
+            timing['save'] = time.time() - started - timing['evaluation']
+            if telemetry is not None:
+                telemetry.record(timing)
+
+            if render_queue is not None:
+                if slot is None:
+                    capsule = moviemaker3.ext.render_capsules.ResultCapsule(
+                        image=image, 
+                        frameindex=(frametime - startframetime),
+                        timing=timing)
+                else:
+                    capsule = moviemaker3.ext.render_capsules.ResultCapsule(
+                        image=None,
+                        frameindex=(frametime - startframetime),
+                        ring=ring, slot=slot, timing=timing)
+                render_queue.put(capsule)
+            elif slot is not None:
+                ring.release(slot)
+            return image
+        except:
+            print "(Renderer) Exception in frame", frametime, 
+            print "at time", realtime, ":"
+            traceback.print_exc()
+            if slot is not None:
+                ring.release(slot)
+            timing['error'] = True
+            if timing['evaluation'] is None:
+                timing['evaluation'] = time.time() - started
+            if telemetry is not None:
+                telemetry.record(timing)
+            if render_queue is not None:
+                render_queue.put(
+                    moviemaker3.ext.render_capsules.ResultCapsule(
+                        image=None,
+                        frameindex=(frametime - startframetime),
+                        error=True, timing=timing))
+            return None
+
+    def _render(self, fn, queue, framerate, file_template, startframetime,
+            render_queue=None, dtype=None, subframes=None, shutter=None,
+            dirty=None, verify=None, ring=None, telemetry=None):
+        """Renders the chunks of frames in *queue* with *fn*.  The queue 
+        holds tuples of the time of enqueueing and the chunk.  The frames of
+        a chunk are rendered in order.  *render_queue*, *dtype*, 
+        *subframes*, *shutter*, *dirty*, *verify*, *ring* and *telemetry* 
+        are optional."""
+
+        if subframes is None:
+            subframes = 1
+        if shutter is None:
+            shutter = 1.0
+
         while not queue.empty():
             try:
                 # Another thread may have raced, we have to not-block.
-                frametime = queue.get(block=False)
-                realtime = float(frametime) / framerate
-                logger.info('Rendering frame %d at %f' % (frametime, 
-                    realtime))
-                try:
-                    ps = Ps()
-                    ps = frametimeline.store(ps, frametime)
-                    ps = realtimeline.store(ps, realtime)
-
-                    image = self.fn(ps)
-                    image.save(file_template % frametime)
-
-                    if render_queue is not None:
-                        render_queue.put(
-                            moviemaker3.ext.render_capsules.ResultCapsule(
-                                image=image, 
-                                frameindex=(frametime - startframetime)))
-                except:
-                    print "(Renderer) Exception in frame", frametime, 
-                    print "at time", realtime, ":"
-                    traceback.print_exc()
-                    if render_queue is not None:
-                        render_queue.put(
-                            moviemaker3.ext.render_capsules.ResultCapsule(
-                                image=None,
-                                frameindex=(frametime - startframetime),
-                                error=True))
-
+                (enqueued, chunk) = queue.get(block=False)
+                queued = time.time() - enqueued
+                previous = None
+                for frametime in chunk:
+                    previous = self._render_frame(fn, frametime, framerate,
+                        file_template, startframetime, previous=previous,
+                        render_queue=render_queue, dtype=dtype,
+                        subframes=subframes, shutter=shutter, dirty=dirty,
+                        verify=verify, ring=ring, queued=queued,
+                        telemetry=telemetry)
+                    # The following frames of the chunk did not wait.
+                    queued = 0.0
                 queue.task_done()
             except Queue.Empty:
                 # Well, another thread was faster.
@@ -3,19 +3,31 @@
 class AnnounceCapsule:
     """Holds the number of frames to be rendered."""
 
-    def __init__(self, nframes):
-        """*nframes* is the number of frames to be rendered.  *shape* is the
-        shape of the images transferred later."""
+    def __init__(self, nframes, frameindices=None):
+        """*nframes* is the number of frames to be rendered.  *frameindices*
+        lists the frameindices of the frames to come, it defaults to 
+        ``range(nframes)``."""
+
+        if frameindices is None:
+            frameindices = range(nframes)
 
         self.nframes = nframes
+        self.frameindices = frameindices
 
 class ResultCapsule:
     """Holds an image and its frameindex."""
 
-    def __init__(self, image, frameindex, error=None):
+    def __init__(self, image, frameindex, error=None, ring=None, slot=None,
+            timing=None):
         """*image* is a PIL image representing a frame resulting from 
-        rendering.  *frameidx* is the index of the frame, always 
-        starting with 0.  *error* (boolean) tells if there was an error."""
+        rendering, or a uint16 ndarray for 16 bit frames.  *frameidx* is the
+        index of the frame, always starting with 0.  *error* (boolean) tells
+        if there was an error.
+        
+        If *ring* is given, the frame is held in slot *slot* of the
+        ``FrameRing`` *ring* instead, and the receiver must call 
+        ``.release()`` when done with it.  *timing* is the timing record 
+        of the frame, see :class:`moviemaker3.ext.telemetry.Telemetry`."""
         
         if error is None:
             error = False
@@ -23,3 +35,19 @@ class ResultCapsule:
         self.error = error
         self.image = image
         self.frameindex = frameindex
+        self.ring = ring
+        self.slot = slot
+        self.timing = timing
+
+    def get_image(self):
+        """Returns the PIL image of the frame."""
+
+        if self.ring is not None:
+            return self.ring.image(self.slot)
+        return self.image
+
+    def release(self):
+        """Releases the slot holding the frame, if any."""
+
+        if self.ring is not None:
+            self.ring.release(self.slot)
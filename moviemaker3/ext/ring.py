@@ -0,0 +1,80 @@
+"""Provides a ring of preallocated frame slots in shared memory, to pass
+rendered frames on without copying."""
+
+import ctypes
+import multiprocessing
+import multiprocessing.sharedctypes
+import numpy
+import PIL.Image
+
+__all__ = ['FrameRing']
+
+class FrameRing:
+    """Holds *nslots* uint8 frames of shape ``[y, x, channels]`` in shared 
+    memory.  A writer acquires a free slot, writes into ``.view(slot)``,
+    and hands the slot index over.  Each of the *nreaders* readers releases
+    the slot when done with it, and the slot is free again when all have
+    released it.  Writers block while all slots are in use, so the memory
+    is fixed regardless of the number of frames.
+
+    The ring can be used from threads, and from processes started after its
+    creation."""
+
+    modes = {1: 'L', 3: 'RGB', 4: 'RGBA'}
+
+    def __init__(self, nslots, shape, nreaders=None):
+        """*shape* is the frame shape ``(y, x, channels)``.  *nreaders* is 
+        the number of releases needed to free a slot, defaulting to 1."""
+
+        if nreaders is None:
+            nreaders = 1
+
+        self.nslots = nslots
+        self.shape = tuple(shape)
+        self.nreaders = nreaders
+
+        self.data = multiprocessing.sharedctypes.RawArray(ctypes.c_uint8,
+            nslots * int(numpy.prod(self.shape)))
+        self.refcounts = multiprocessing.Array(ctypes.c_int, nslots)
+        self.free = multiprocessing.Queue()
+        for slot in xrange(0, nslots):
+            self.free.put(slot)
+
+    def view(self, slot):
+        """Returns the ndarray of slot *slot*, sharing the memory."""
+
+        frames = numpy.frombuffer(self.data, dtype=numpy.uint8)
+        return frames.reshape((self.nslots,) + self.shape)[slot]
+
+    def image(self, slot):
+        """Returns a PIL image of slot *slot*.  For one and four channels,
+        the image shares the memory of the slot."""
+
+        (shapey, shapex, channels) = self.shape
+        mode = self.modes[channels]
+        return PIL.Image.frombuffer(mode, (shapex, shapey), self.view(slot),
+            'raw', mode, 0, 1)
+
+    def write(self, slot, stream):
+        """Writes the raw data of slot *slot* to the file-like *stream*, 
+        e.g. the stdin of an encoder process reading raw video."""
+
+        stream.write(self.view(slot).data)
+
+    def acquire(self, block=True, timeout=None):
+        """Returns the index of a free slot.  Waits for a slot to be
+        released if *block* is true, at most *timeout* seconds if given.
+        Raises ``Queue.Empty`` if no slot is available."""
+
+        slot = self.free.get(block, timeout)
+        with self.refcounts.get_lock():
+            self.refcounts[slot] = self.nreaders
+        return slot
+
+    def release(self, slot):
+        """Releases slot *slot* for one reader."""
+
+        with self.refcounts.get_lock():
+            self.refcounts[slot] -= 1
+            if self.refcounts[slot] == 0:
+                self.free.put(slot)
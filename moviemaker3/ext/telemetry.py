@@ -0,0 +1,153 @@
+import csv
+import json
+import time
+import threading
+import numpy
+
+"""Records the per-frame timings of a render and derives live
+aggregates."""
+
+__all__ = ['Telemetry']
+
+class Telemetry:
+    """Collects the timing records of the frames of a render, as handed
+    over by ``Render``, optionally writes them to a log file, and provides
+    the frame rate, percentiles of the frame time and the estimated time of
+    arrival.  The timing records are dicts with the keys:
+
+    *   ``'frametime'``, the frame rendered,
+    *   ``'worker'``, the name of the rendering thread,
+    *   ``'queued'``, the time the frame's chunk waited in the queue,
+        recorded with the first frame of the chunk, else 0,
+    *   ``'evaluation'``, the time to evaluate the Function,
+    *   ``'save'``, the time to convert and save the frame,
+    *   ``'error'``, whether the frame failed,
+    *   ``'finished'``, the time since the start of the render when the
+        frame was done.
+
+    Times are in seconds.  Recording is thread-safe."""
+
+    fields = ['frametime', 'worker', 'queued', 'evaluation', 'save', 
+        'error', 'finished']
+
+    def __init__(self, path=None, format=None):
+        """*path* is the log file to write, if given.  *format* is
+        ``'jsonl'`` (JSON lines, one object per frame) or ``'csv'``, and
+        defaults to ``'csv'`` if *path* ends with ``.csv``, else to
+        ``'jsonl'``."""
+
+        if format is None:
+            if path is not None and path.endswith('.csv'):
+                format = 'csv'
+            else:
+                format = 'jsonl'
+        if format not in ('jsonl', 'csv'):
+            raise ValueError('Unknown telemetry format: %s' % format)
+
+        self.path = path
+        self.format = format
+        self.lock = threading.Lock()
+        self.stream = None
+        self.writer = None
+        self.start()
+
+    def start(self, nframes=None):
+        """Starts a render of *nframes* frames, discarding the records
+        collected so far, and opens the log file, if any."""
+
+        with self.lock:
+            self.nframes = nframes
+            self.records = []
+            self.starttime = time.time()
+            if self.path is not None and self.stream is None:
+                self.stream = open(self.path, 'w')
+                if self.format == 'csv':
+                    self.writer = csv.DictWriter(self.stream, self.fields)
+                    self.writer.writeheader()
+
+    def record(self, timing):
+        """Adds the timing record *timing* and writes it to the log.  The
+        ``'finished'`` entry is filled in if missing."""
+
+        with self.lock:
+            if timing.get('finished') is None:
+                timing = dict(timing,
+                    finished=(time.time() - self.starttime))
+            self.records.append(timing)
+            if self.stream is not None:
+                if self.writer is not None:
+                    self.writer.writerow(timing)
+                else:
+                    self.stream.write(json.dumps(timing, sort_keys=True))
+                    self.stream.write('\n')
+                self.stream.flush()
+
+    def close(self):
+        """Closes the log file."""
+
+        with self.lock:
+            if self.stream is not None:
+                self.stream.close()
+                self.stream = None
+                self.writer = None
+
+    def frame_times(self):
+        """Returns the array of the times taken by the frames recorded,
+        evaluation and saving."""
+
+        with self.lock:
+            return numpy.asarray([timing['evaluation'] + (timing['save'] or 0)
+                for timing in self.records], dtype=numpy.float64)
+
+    def fps(self):
+        """Returns the frames per second since the start, or None before the
+        first frame."""
+
+        with self.lock:
+            ndone = len(self.records)
+            elapsed = time.time() - self.starttime
+        if ndone == 0 or elapsed <= 0:
+            return None
+        return ndone / elapsed
+
+    def percentile(self, q):
+        """Returns the *q*-th percentile of the frame times, or None before
+        the first frame."""
+
+        times = self.frame_times()
+        if len(times) == 0:
+            return None
+        return numpy.percentile(times, q)
+
+    def eta(self):
+        """Returns the estimated seconds until all frames are done, or None
+        if not known."""
+
+        fps = self.fps()
+        if fps is None or self.nframes is None:
+            return None
+        return max(0, self.nframes - len(self.records)) / fps
+
+    def summary(self):
+        """Returns a dict with the numbers of frames done and failed, and
+        the current ``'fps'``, ``'p50'``, ``'p95'`` and ``'eta'``."""
+
+        with self.lock:
+            ndone = len(self.records)
+            nerrors = len([timing for timing in self.records
+                if timing['error']])
+        return dict(done=ndone, errors=nerrors, total=self.nframes,
+            fps=self.fps(), p50=self.percentile(50), p95=self.percentile(95),
+            eta=self.eta())
+
+    def format_summary(self):
+        """Returns the summary as a short line of text."""
+
+        summary = self.summary()
+        if summary['fps'] is None:
+            return ''
+        text = '%.2f fps, p50 %.3f s, p95 %.3f s' % (summary['fps'],
+            summary['p50'], summary['p95'])
+        if summary['eta'] is not None:
+            text += ', ETA %d s' % round(summary['eta'])
+        return text
@@ -1,10 +1,12 @@
 import Tkinter
+import PIL.Image
 import PIL.ImageTk
 import threading
 import Queue
 import traceback
 import numpy
 import moviemaker3.ext.render_capsules
+from moviemaker3.ext.telemetry import Telemetry
 
 """Provides a Tkinter.Frame descendant capable of rendering with
 graphical feedback."""
@@ -29,6 +31,10 @@ class StatusBar(Tkinter.Frame):
         self.labels = []  # .setup() needs .labels initialised.
         self.nbins = nbins
 
+        # Shows the live aggregates, right of the bins:
+        self.info = Tkinter.Label(self, borderwidth=0)
+        self.info.pack(side=Tkinter.RIGHT)
+
     def setup(self, nslots):
         """Setup the StatusBar.  If *nbins* > *nslots*, *nbins* is set to 
         *nslots*."""
@@ -81,6 +87,11 @@ class StatusBar(Tkinter.Frame):
                 if state == self.state_ok:
                     label.configure(background = 'green')
 
+    def show(self, text):
+        """Shows *text* right of the bins."""
+
+        self.info.configure(text=text)
+
     def error(self, slot):
         """Signals an error in slot SLOT."""
 
@@ -95,7 +106,10 @@ class RenderFrame(Tkinter.Frame):
     """A Tkinter.Frame which can render events with graphical feedback.  The
     .start() method must be called once to start the polling mechanism. 
     
-    Use the .render_queue as argument to a Renderer's .render() method."""
+    Use the .render_queue as argument to a Renderer's .render() method.
+    The frame rate, frame time percentiles and ETA derived from the 
+    capsules' timings are shown in the status bar, and are available as
+    ``.telemetry``."""
 
     def __init__(self, master, nbins=None,
             *frame_args, **frame_kwargs):
@@ -109,6 +123,10 @@ class RenderFrame(Tkinter.Frame):
         # The message queue for ImageCapsules:
         self.render_queue = Queue.Queue()
 
+        # The aggregates of the frames received:
+        self.telemetry = Telemetry()
+        self.positions = {}
+
         # Initialise status bar ...
 
         self.status_bar = StatusBar(self, nbins=nbins)
@@ -164,14 +182,24 @@ class RenderFrame(Tkinter.Frame):
                 if isinstance(capsule,
                         moviemaker3.ext.render_capsules.AnnounceCapsule):
                     self.status_bar.setup(nslots=capsule.nframes)
+                    self.telemetry.start(nframes=capsule.nframes)
+                    # The status slots of the frameindices:
+                    self.positions = dict([(frameindex, position) for 
+                        (position, frameindex) in 
+                        enumerate(capsule.frameindices)])
                 elif isinstance(capsule, 
                         moviemaker3.ext.render_capsules.ResultCapsule):
+                    position = self.positions[capsule.frameindex]
                     if not capsule.error:
-                        self.status_bar.enable(capsule.frameindex)
+                        self.status_bar.enable(position)
                     else:
-                        self.status_bar.error(capsule.frameindex)
+                        self.status_bar.error(position)
+                    if capsule.timing is not None:
+                        self.telemetry.record(capsule.timing)
                     image_capsules.append(capsule)
 
+            self.status_bar.show(self.telemetry.format_summary())
+
             # Display the latest frame without errors ...
 
             image_capsules.sort(key=lambda c: c.frameindex)
@@ -179,10 +207,15 @@ class RenderFrame(Tkinter.Frame):
             for index in xrange(-1, -len(image_capsules) - 1, -1):
                 capsule = image_capsules[index]
                 if not capsule.error:
-                    photo_image = PIL.ImageTk.PhotoImage(capsule.image)
+                    image = capsule.get_image()
+                    if isinstance(image, numpy.ndarray):
+                        # 16 bit frame, display the upper byte.
+                        image = PIL.Image.fromarray(
+                            (image >> 8).astype(numpy.uint8))
+                    photo_image = PIL.ImageTk.PhotoImage(image)
                     old_id = self.photo_id
-                    self.canvas.configure(width=capsule.image.size[0],
-                        height=capsule.image.size[1])
+                    self.canvas.configure(width=image.size[0],
+                        height=image.size[1])
                     self.photo_id = self.canvas.create_image((0, 0),
                         image=photo_image, anchor=Tkinter.NW)
                     if old_id is not None:
@@ -192,6 +225,11 @@ class RenderFrame(Tkinter.Frame):
                     self.photo_image = photo_image
                     break
 
+            # The PhotoImage holds a copy, so release all frames ...
+
+            for capsule in image_capsules:
+                capsule.release()
+
         except Exception, exc:
             print "(RenderFrame) Exception while polling:"
             traceback.print_exc()
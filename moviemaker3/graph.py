@@ -0,0 +1,107 @@
+"""Provides inspection and rewriting of Function graphs.  The children of a
+Function are the Functions it holds in its attributes, either directly or as
+items of lists, tuples and dicts."""
+
+import copy
+from fframework import Function
+
+__all__ = ['children', 'walk', 'substitute', 'rewrite']
+
+def _attributes(fn):
+    """Returns the attributes of *fn* as a sorted list of (name, value)."""
+
+    return sorted(getattr(fn, '__dict__', {}).items())
+
+def _functions(value):
+    """Returns the Functions in the attribute value *value*."""
+
+    if isinstance(value, Function):
+        return [value]
+    elif type(value) in (list, tuple):
+        return [item for item in value if isinstance(item, Function)]
+    elif type(value) is dict:
+        return [item for (key, item) in sorted(value.items()) 
+            if isinstance(item, Function)]
+    return []
+
+def _substituted(value, mapping):
+    """Returns *value* with *mapping* applied to the Functions in it.  
+    Returns *value* itself if no Function is contained."""
+
+    if isinstance(value, Function):
+        return mapping(value)
+    elif type(value) in (list, tuple):
+        if not _functions(value):
+            return value
+        return type(value)([mapping(item) if isinstance(item, Function) \
+            else item for item in value])
+    elif type(value) is dict:
+        if not _functions(value):
+            return value
+        return dict([(key, mapping(item) if isinstance(item, Function) \
+            else item) for (key, item) in value.items()])
+    return value
+
+def children(fn):
+    """Returns the list of Functions held by *fn*."""
+
+    result = []
+    for (name, value) in _attributes(fn):
+        result.extend(_functions(value))
+    return result
+
+def walk(fn):
+    """Returns all Functions in the graph of *fn*, each one once, with the
+    children before their parents."""
+
+    order = []
+    seen = set()
+
+    def visit(node):
+        if id(node) in seen:
+            return
+        seen.add(id(node))
+        for child in children(node):
+            visit(child)
+        order.append(node)
+
+    visit(fn)
+    return order
+
+def substitute(fn, mapping):
+    """Returns a shallow copy of *fn*, where every child Function is replaced
+    by the result of *mapping* called with it."""
+
+    copied = copy.copy(fn)
+    for (name, value) in _attributes(fn):
+        new_value = _substituted(value, mapping)
+        if new_value is not value:
+            setattr(copied, name, new_value)
+    return copied
+
+def rewrite(fn, replace):
+    """Returns the graph of *fn* with each Function, for which *replace* 
+    returns something else than None, replaced by that return value.
+    Replacements are not descended into.  Functions whose children are
+    changed are copied; the graph of *fn* itself is left untouched."""
+
+    memo = {}
+
+    def visit(node):
+        if id(node) in memo:
+            return memo[id(node)]
+        replacement = replace(node)
+        if replacement is None:
+            changed = []
+            def mapping(child):
+                new_child = visit(child)
+                if new_child is not child:
+                    changed.append(child)
+                return new_child
+            replacement = substitute(node, mapping)
+            if not changed:
+                replacement = node
+        memo[id(node)] = replacement
+        return replacement
+
+    return visit(fn)
@@ -1,5 +1,6 @@
 import numpy
 from fframework import asfunction, OpFunction
+from moviemaker3.precision import asdtype
 
 __all__ = ['Angle']
 
@@ -13,7 +14,7 @@ class Angle(OpFunction):
 
     def __call__(self, ps):
         """Returns the arctan2.  The (y, x) coordinate is in the last 
-        dimension."""
+        dimension.  Computes in the dtype demanded by *ps*."""
 
-        meshT = self.mesh(ps).T
+        meshT = asdtype(self.mesh(ps), ps).T
         return numpy.arctan2(meshT[0], meshT[1]).T
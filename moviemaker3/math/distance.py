@@ -1,5 +1,6 @@
 import numpy
 from fframework import asfunction, OpFunction
+from moviemaker3.precision import asdtype
 
 __all__ = ['Distance']
 
@@ -14,8 +15,9 @@ class Distance(OpFunction):
     def __call__(self, ps):
         """Returns the distance of the points of the mesh from the origin.
         
-        The spacial coordinates are in the last dimension."""
+        The spacial coordinates are in the last dimension.  Computes in the
+        dtype demanded by *ps*."""
 
-        meshT = self.mesh(ps).T
+        meshT = asdtype(self.mesh(ps), ps).T
 
         return numpy.sqrt((meshT ** 2).sum(axis=0)).T
@@ -1,5 +1,6 @@
 import numpy
 from fframework import Function, asfunction, Constant, OpFunction
+from moviemaker3.precision import asdtype
 
 class Interp(OpFunction):
     """The pendant to ``numpy.interp()``."""
@@ -16,7 +17,8 @@ class Interp(OpFunction):
 
     def __call__(self, ps):
         """Calls ``numpy.interp()`` with ``.xp(ps)``, ``.fp(ps)``, 
-        ``.left(ps)``, ``.right(ps)``."""
+        ``.left(ps)``, ``.right(ps)``.  ``numpy.interp()`` computes in
+        float64, the result is converted to the dtype demanded by *ps*."""
 
         xp = self.xp(ps)
         fp = self.fp(ps)
@@ -24,7 +26,8 @@ class Interp(OpFunction):
         left = self.left(ps)
         right = self.right(ps)
 
-        return numpy.interp(xp=xp, fp=fp, x=x, left=left, right=right)
+        return asdtype(numpy.interp(xp=xp, fp=fp, x=x, left=left, 
+            right=right), ps)
 
 class Bezier(OpFunction):
     """Carries out Bezier interpolation."""
@@ -42,10 +45,11 @@ class Bezier(OpFunction):
 
     def __call__(self, ps):
         """Bezier-interpolates the result of ``.points(ps)`` at the position
-        ``.progress(ps)``."""
+        ``.progress(ps)``.  The progress is converted to the dtype demanded
+        by *ps*."""
 
         points = self.points(ps)
-        progress = self.progress(ps)
+        progress = asdtype(self.progress(ps), ps)
 
         while(len(points) > 1):
             interpolated_points = []
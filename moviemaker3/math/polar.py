@@ -2,6 +2,7 @@
 
 import numpy
 from fframework import asfunction, OpFunction
+from moviemaker3.precision import asdtype
 
 __all__ = ['Polar2Cartesian', 'Cartesian2Polar']
 
@@ -17,9 +18,10 @@ class Polar2Cartesian(OpFunction):
     def __call__(self, ps):
         """Calculates the cartesian coordinates (y, x) from the polar 
         coordinates.  The spacial (y, x) coordinaates will be in the last
-        dimension of the returned array."""
+        dimension of the returned array.  Computes in the dtype demanded by
+        *ps*."""
 
-        meshT = self.mesh(ps).T
+        meshT = asdtype(self.mesh(ps), ps).T
 
         rT = meshT[0]
         phiT = meshT[1]
@@ -39,9 +41,9 @@ class Cartesian2Polar(OpFunction):
     def __call__(self, ps):
         """Calculates the polar coordinates (r, phi) from the cartesian 
         coordinates.  The (r, phi) coordinates will be in the last dimension
-        of the array returned."""
+        of the array returned.  Computes in the dtype demanded by *ps*."""
         
-        meshT = self.mesh(ps).T
+        meshT = asdtype(self.mesh(ps), ps).T
 
         yT = meshT[0]
         xT = meshT[1]
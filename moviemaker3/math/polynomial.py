@@ -1,4 +1,5 @@
 from fframework import OpFunction, asfunction, Constant
+from moviemaker3.precision import asdtype
 
 class Polynomial(OpFunction):
     """Implements polynomials with Functions a coefficients and argument."""
@@ -18,14 +19,15 @@ class Polynomial(OpFunction):
 
     def __call__(self, ps):
         """Returns the polynomial specified by ``.coefficients()`` at the
-        position ``.x()``."""
+        position ``.x()``.  Computes in the dtype demanded by *ps*."""
 
         coefficients = self.coefficients(ps)
-        x = self.x(ps)
-        null = self.null(ps)
+        x = asdtype(self.x(ps), ps)
+        null = asdtype(self.null(ps), ps)
 
         result = null
         for (order, coefficient) in enumerate(coefficients):
-            result += coefficient * x ** order
+            # x ** order upcasts float32 scalars to float64.
+            result += asdtype(coefficient, ps) * asdtype(x ** order, ps)
 
         return result
@@ -1,5 +1,6 @@
 import numpy
 from fframework import asfunction, OpFunction
+from moviemaker3.precision import asdtype
 
 __all__ = ['ScalarProduct']
 
@@ -16,9 +17,10 @@ class ScalarProduct(OpFunction):
     def __call__(self, ps):
         """Calculates the dot product of each mesh vector and the 
         ``.vector()``.  The spacial coordinates are in the last dimension of
-        the mesh and the vector array."""
+        the mesh and the vector array.  Computes in the dtype demanded by
+        *ps*."""
 
-        vector = self.vector(ps)
-        mesh = self.mesh(ps)
+        vector = asdtype(self.vector(ps), ps)
+        mesh = asdtype(self.mesh(ps), ps)
 
         return numpy.tensorproduct(mesh, vector, (-1, -1))
@@ -0,0 +1,50 @@
+import numpy
+from fframework import OpFunction, asfunction
+from moviemaker3.precision import get_dtype
+from moviemaker3.region import get_region
+
+__all__ = ['Mesh']
+
+class Mesh(OpFunction):
+    """Generates a regular 2D mesh.  The spacial (y, x) coordinates are in
+    the last dimension."""
+
+    def __init__(self, shape, ylim=None, xlim=None):
+        """*shape* is the shape ``(shapey, shapex)`` of the mesh in points.
+        *ylim* and *xlim* give the coordinates ``(first, last)`` of the first
+        and the last point along y and x; they default to the pixel indices.
+        All are Functions, or are passed through ``asfunction``."""
+
+        self.shape = asfunction(shape)
+        self.ylim = asfunction(ylim)
+        self.xlim = asfunction(xlim)
+
+    def __call__(self, ps):
+        """Returns the mesh in the dtype demanded by *ps*, defaulting to 
+        float64.  The coordinates are computed in float64 before
+        conversion.  If *ps* demands a region, only the points in the region
+        are returned, with the same coordinates as in the full mesh."""
+
+        (shapey, shapex) = self.shape(ps)
+        ylim = self.ylim(ps)
+        xlim = self.xlim(ps)
+        if ylim is None:
+            ylim = (0, shapey - 1)
+        if xlim is None:
+            xlim = (0, shapex - 1)
+        dtype = get_dtype(ps)
+        if dtype is None:
+            dtype = numpy.float64
+
+        y = numpy.linspace(ylim[0], ylim[1], shapey)
+        x = numpy.linspace(xlim[0], xlim[1], shapex)
+        region = get_region(ps)
+        if region is not None:
+            (y0, y1, x0, x1) = region
+            y = y[y0:y1]
+            x = x[x0:x1]
+
+        mesh = numpy.empty((len(y), len(x), 2), dtype=dtype)
+        mesh[..., 0] = y[:, numpy.newaxis]
+        mesh[..., 1] = x
+        return mesh
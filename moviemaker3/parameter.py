@@ -1,7 +1,71 @@
+import threading
 from fframework import OpFunction
 
 __all__ = ['p']
 
+class Lazy:
+    """A parameter value which is computed when it is retrieved from a
+    ``Ps`` for the first time.  The result is memoized, also for all copies
+    of the ``Ps`` holding the ``Lazy``."""
+
+    def __init__(self, fn, ps, root=None):
+        """The value is ``fn(ps)``.  *root* is the ``Lazy`` this one is a
+        copy of, see ``.copy()``."""
+
+        if root is None:
+            root = self
+
+        self.fn = fn
+        self.ps = ps
+        self.root = root
+        self.computed = False
+        self.value = None
+        self.lock = threading.Lock()
+
+    def get(self):
+        """Returns the value, computing it on the first call."""
+
+        with self.lock:
+            if not self.computed:
+                self.value = self.fn(self.ps)
+                self.computed = True
+                # Not needed anymore, and might hold large arrays:
+                self.fn = None
+                self.ps = None
+            return self.value
+
+    def copy(self):
+        """Returns the value for a copy of the ``Ps`` holding *self*.  Once
+        computed, this is the value, copied if it is a ``Ps``.  Before, it 
+        is a ``Lazy`` sharing the computation of the original ``Lazy``, and
+        yielding a copy if the value is a ``Ps``."""
+
+        if self.computed:
+            value = self.value
+        elif self.root.computed:
+            value = self.root.value
+        else:
+            return Lazy(_copied, self.root, root=self.root)
+        if isinstance(value, Ps):
+            return value.copy()
+        return value
+
+def _copied(lazy):
+    """Returns the value of the ``Lazy`` *lazy*, copied if it is a 
+    ``Ps``."""
+
+    value = lazy.get()
+    if isinstance(value, Ps):
+        return value.copy()
+    return value
+
+def force(value):
+    """Returns the value of *value* if it is a ``Lazy``, else *value*."""
+
+    if isinstance(value, Lazy):
+        return value.get()
+    return value
+
 class Ps(dict):
     """Holds a number of parameter values.
     
@@ -59,6 +123,10 @@ class Ps(dict):
         if leaf is None:
             dict.__setitem__(self, root, value)
         else:
+            if isinstance(dict.get(self, root), Lazy):
+                # Do not change the value held by the Lazy, it might be 
+                # shared with other ``Ps``.
+                dict.__setitem__(self, root, _copied(dict.get(self, root)))
             self.setdefault(root, Ps())
             self[root].extend(leaf, value)
         return self
@@ -77,26 +145,27 @@ class Ps(dict):
 
     def copy(self):
         """Returns a ``Ps`` with copied ``.parameters``.  All ``Ps`` objects
-        will be copied, but not the data."""
+        will be copied, but not the data.  ``Lazy`` values stay lazy, but 
+        yield copies of ``Ps`` values."""
 
         new_data = []
         for (key, value) in self.items():
-            if isinstance(value, Ps):
+            if isinstance(value, (Ps, Lazy)):
                 new_data.append((key, value.copy()))
             else:
                 new_data.append((key, value))
         return Ps(parameters=dict(new_data))
 
     def retrieve(self, name):
-        """Retrieves the value of *name*."""
+        """Retrieves the value of *name*.  ``Lazy`` values are computed."""
 
         components = name.split('/')
         root = components[0]
         leaf = '/'.join(components[1:])
         if len(components) == 1:
-            return dict.__getitem__(self, root)
+            return force(dict.__getitem__(self, root))
         else:
-            return dict.__getitem__(self, root)[leaf]
+            return force(dict.__getitem__(self, root))[leaf]
 
     def __getitem__(self, key):
         """Alias for ``.retrieve()`` for syntax like e.g. ``ps['foobar']``."""
@@ -0,0 +1,457 @@
+"""Compiles Function graphs into linear evaluation plans."""
+
+import copy
+import threading
+import time
+import numpy
+from fframework import OpFunction, Constant
+from moviemaker3.parameter import p, Ps
+from moviemaker3.graph import children, walk, substitute
+from moviemaker3.mesh import Mesh
+from moviemaker3.precision import dtypeline, get_dtype
+from moviemaker3.region import get_region
+import moviemaker3.stacks
+import moviemaker3.math.angle
+import moviemaker3.math.distance
+import moviemaker3.math.interpolate
+import moviemaker3.math.polar
+import moviemaker3.math.polynomial
+import moviemaker3.math.scalarproduct
+
+__all__ = ['Plan', 'Cached', 'PerFrame', 'cache_static']
+
+frametimeline = p('time/frame')
+
+# Classes, whose instances evaluate each of their children exactly once with
+# the parameters they are called with themselves:
+transparent = [
+    moviemaker3.stacks.AdditiveStack,
+    moviemaker3.stacks.AlphaStack,
+    moviemaker3.stacks.OverStack,
+    moviemaker3.stacks.Premultiply,
+    moviemaker3.stacks.WeightedStack,
+    moviemaker3.math.angle.Angle,
+    moviemaker3.math.distance.Distance,
+    moviemaker3.math.interpolate.Interp,
+    moviemaker3.math.polar.Polar2Cartesian,
+    moviemaker3.math.polar.Cartesian2Polar,
+    moviemaker3.math.polynomial.Polynomial,
+    moviemaker3.math.scalarproduct.ScalarProduct,
+    Mesh]
+
+# Classes in ``transparent``, whose instances read parameters by themselves,
+# other than the ``'dtype'``.  They are never evaluated at compile time:
+parametrised = [
+    Mesh]
+
+# Classes, whose instances read no parameters by themselves and call their
+# children with the parameters they are called with themselves, though not
+# necessarily once.  Their results are cached per frame by ``cache_static``
+# where possible:
+pure = []
+
+def register(cls):
+    """Declares the instances of *cls* to evaluate each of their children
+    exactly once with the parameters they are called with.  They are 
+    flattened into plans then.  Returns *cls*."""
+
+    transparent.append(cls)
+    return cls
+
+def register_pure(cls):
+    """Declares the instances of *cls* to read no parameters by themselves,
+    and to call their children with the parameters they are called with.
+    Their results are cached per frame by ``cache_static`` then.  Returns
+    *cls*."""
+
+    pure.append(cls)
+    return cls
+
+class Slot(OpFunction):
+    """Reads an intermediate result of the running evaluation of a plan."""
+
+    def __init__(self, plan, index):
+        """*index* is the index of the result in *plan*."""
+
+        self.plan = plan
+        self.index = index
+
+    def __call__(self, ps):
+        """Returns the result, ignoring *ps*."""
+
+        return self.plan._local.values[self.index]
+
+class StartStep(OpFunction):
+    """Starts the reduction of a stack in a plan."""
+
+    def __init__(self, stack):
+        """*stack* is the stack without elements."""
+
+        self.stack = stack
+
+    def __call__(self, ps):
+        """Returns the initial accumulator."""
+
+        return self.stack.start(ps)
+
+class CombineStep(OpFunction):
+    """Folds the result of one element of a stack into the accumulator."""
+
+    def __init__(self, stack, accumulator, result):
+        """*accumulator* and *result* are Slots."""
+
+        self.stack = stack
+        self.accumulator = accumulator
+        self.result = result
+
+    def __call__(self, ps):
+        """Returns the new accumulator."""
+
+        return self.stack.combine(self.accumulator(ps), self.result(ps))
+
+class FinishStep(OpFunction):
+    """Finishes the reduction of a stack in a plan."""
+
+    def __init__(self, stack, accumulator):
+        """*accumulator* is a Slot."""
+
+        self.stack = stack
+        self.accumulator = accumulator
+
+    def __call__(self, ps):
+        """Returns the result of the stack."""
+
+        return self.stack.finish(self.accumulator(ps))
+
+class Plan(OpFunction):
+    """Evaluates a Function graph by executing a topologically ordered list
+    of steps.  Use like this::
+        
+        plan = Plan(scene)
+        image = (plan | PILext())(ps)
+
+    The graph is flattened through instances of the classes in 
+    ``transparent``.  Each of them becomes one step reading the results of 
+    its children from slots.  Other Functions become one step each and are
+    called as they are.  Identical Functions and ``p`` objects with the same
+    name are evaluated once.  Stacks are reduced incrementally: the result
+    of each element is combined into the accumulator as soon as it has been
+    computed, and dropped then, so that only one layer and the accumulator
+    are held at a time.  Other intermediate results are dropped as soon as
+    their last reader has been executed.  Stacks are compiled without their
+    ``.pool``, because their elements are evaluated by the plan itself.
+
+    Transparent subgraphs with only ``Constant`` leaves are evaluated once
+    per ``'dtype'``, on the first call with that dtype.  Instances of the 
+    classes in ``parametrised`` are not folded that way.
+    
+    The graph must not be changed after compilation."""
+
+    def __init__(self, fn):
+        """Compiles *fn*."""
+
+        self.fn = fn
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._initials = {}
+
+        foldable = {}
+        for node in walk(fn):
+            foldable[id(node)] = isinstance(node, Constant) or \
+                (isinstance(node, tuple(transparent)) and
+                    not isinstance(node, tuple(parametrised)) and
+                    all([foldable[id(child)] for child in children(node)]))
+
+        slots = {}
+        folds = []
+        steps = []
+        nslots = [0]
+
+        def allocate():
+            nslots[0] += 1
+            return nslots[0] - 1
+
+        def flatten(node, inputs):
+            def mapping(child):
+                inputs.append(visit(child))
+                return Slot(self, inputs[-1])
+            function = substitute(node, mapping)
+            if getattr(function, 'pool', None) is not None:
+                # The slots are read from the thread running the plan.
+                function.pool = None
+            return function
+
+        def reduce(stack):
+            # The background is computed before the elements, and each
+            # element is combined right after its own steps.
+            shell = copy.copy(stack)
+            shell.elements = []
+            inputs = []
+            shell = flatten(shell, inputs)
+            accumulator = allocate()
+            steps.append((accumulator, StartStep(shell), inputs))
+            for element in stack.elements:
+                result = visit(element)
+                steps.append((accumulator, CombineStep(shell,
+                    Slot(self, accumulator), Slot(self, result)),
+                    [accumulator, result]))
+            index = allocate()
+            steps.append((index, FinishStep(shell, Slot(self, accumulator)),
+                [accumulator]))
+            return index
+
+        def visit(node):
+            if isinstance(node, p):
+                key = ('p', node.name)
+            else:
+                key = id(node)
+            if key in slots:
+                return slots[key]
+
+            if foldable[id(node)]:
+                index = allocate()
+                folds.append((index, node))
+            elif isinstance(node, moviemaker3.stacks.Stack) and \
+                    isinstance(node, tuple(transparent)):
+                index = reduce(node)
+            elif isinstance(node, tuple(transparent)):
+                inputs = []
+                function = flatten(node, inputs)
+                index = allocate()
+                steps.append((index, function, inputs))
+            else:
+                index = allocate()
+                steps.append((index, node, []))
+            slots[key] = index
+            return index
+
+        self.root = visit(fn)
+        self.size = nslots[0]
+        self.folds = folds
+
+        # Liveness of the intermediate results ...
+
+        folded = set([index for (index, node) in folds])
+        last_use = {}
+        for (position, (index, function, inputs)) in enumerate(steps):
+            for input in inputs:
+                if input not in folded:
+                    last_use[input] = position
+        releases = [[] for step in steps]
+        for (input, position) in last_use.items():
+            if input != self.root:
+                releases[position].append(input)
+
+        self.steps = [(index, function, release) for \
+            ((index, function, inputs), release) in zip(steps, releases)]
+
+    def initial(self, ps):
+        """Returns the slots filled with the folded subgraphs, evaluated with
+        the ``'dtype'`` of *ps*."""
+
+        dtype = get_dtype(ps)
+        initial = self._initials.get(dtype)
+        if initial is None:
+            if dtype is None:
+                foldps = Ps()
+            else:
+                foldps = dtypeline.store(Ps(), dtype)
+            initial = [None] * self.size
+            for (index, node) in self.folds:
+                initial[index] = node(foldps)
+            with self._lock:
+                initial = self._initials.setdefault(dtype, initial)
+        return initial
+
+    def __call__(self, ps):
+        """Executes the steps with *ps*, and returns the result."""
+
+        values = list(self.initial(ps))
+        previous = getattr(self._local, 'values', None)
+        self._local.values = values
+        try:
+            for (index, function, release) in self.steps:
+                values[index] = function(ps)
+                for input in release:
+                    values[input] = None
+            return values[self.root]
+        finally:
+            self._local.values = previous
+
+class Cached(OpFunction):
+    """Evaluates a Function on the first call, and returns that result on
+    all calls.  Calls demanding a region are passed through without 
+    caching."""
+
+    def __init__(self, fn):
+        """*fn* is the Function to evaluate."""
+
+        self.fn = fn
+        self.computed = False
+        self.value = None
+        self.lock = threading.Lock()
+
+    def __call__(self, ps):
+        """Returns the result of the first call."""
+
+        if get_region(ps) is not None:
+            return self.fn(ps)
+        if not self.computed:
+            with self.lock:
+                if not self.computed:
+                    self.value = self.fn(ps)
+                    self.computed = True
+        return self.value
+
+class PerFrame(OpFunction):
+    """Evaluates a Function once per frame.  The result is reused by the
+    following calls in the same thread with the same ``'time/frame'`` and
+    ``'dtype'``, e.g. for the subframes of a frame.  Calls demanding a 
+    region, and calls without a single frametime, are passed through."""
+
+    def __init__(self, fn):
+        """*fn* is the Function to evaluate."""
+
+        self.fn = fn
+        self._local = threading.local()
+
+    def __call__(self, ps):
+        """Returns the result for the frame of *ps*."""
+
+        if get_region(ps) is not None:
+            return self.fn(ps)
+        try:
+            frametime = frametimeline(ps)
+        except KeyError:
+            return self.fn(ps)
+        if numpy.ndim(frametime) != 0:
+            return self.fn(ps)
+
+        key = (frametime, get_dtype(ps))
+        local = self._local
+        if getattr(local, 'key', None) != key:
+            # Drop the previous frame's result before computing.
+            local.key = None
+            local.value = self.fn(ps)
+            local.key = key
+        return local.value
+
+def _varying(names, varying):
+    """Tells if any of the parameter *names* is, or is part of, or holds 
+    one of the *varying* parameter names."""
+
+    for name in names:
+        for other in varying:
+            if name == other or name.startswith(other + '/') or \
+                    other.startswith(name + '/'):
+                return True
+    return False
+
+def cache_static(fn):
+    """Returns the graph of *fn* with its largest static subgraphs wrapped 
+    into ``Cached``, and its largest other subgraphs not depending on the
+    real time wrapped into ``PerFrame``.
+
+    Only Functions called with the parameters of the frame are wrapped:
+    *fn* itself, and the children of instances of the classes in 
+    ``transparent`` reached that way.  Other Functions are left as they 
+    are, including all below them, as they might be called with other 
+    arguments, e.g. the second stage of a pipe.
+
+    Static are subgraphs of instances of the classes in ``transparent`` 
+    with only ``Constant`` leaves.  They depend on no other parameters than
+    the ``'dtype'`` and the ``'region'``.  Subgraphs not depending on the 
+    real time consist of instances of the classes in ``transparent`` and 
+    ``pure``, ``Constant`` objects, and ``p`` objects reading neither 
+    ``'time/real'`` nor a parameter stored by some Function in the graph.
+    Stored parameters are those held as ``.p``, as by ``Assignment`` and
+    ``Multid``.  The parameters handed over are assumed to be the same for
+    equal frametimes."""
+
+    static = {}
+    for node in walk(fn):
+        static[id(node)] = isinstance(node, Constant) or \
+            (isinstance(node, tuple(transparent)) and
+                all([static[id(child)] for child in children(node)]))
+
+    varying = set(['time/real'])
+    for node in walk(fn):
+        if not isinstance(node, p) and isinstance(getattr(node, 'p', None), 
+                p):
+            varying.add(node.p.name)
+
+    perframe = {}
+    for node in walk(fn):
+        if isinstance(node, p):
+            perframe[id(node)] = not _varying([node.name], varying)
+        else:
+            perframe[id(node)] = static[id(node)] or \
+                (isinstance(node, tuple(transparent + pure)) and
+                    all([perframe[id(child)] for child in children(node)]))
+
+    memo = {}
+
+    def visit(node):
+        if id(node) in memo:
+            return memo[id(node)]
+        if static[id(node)]:
+            if isinstance(node, Constant):
+                replacement = node
+            else:
+                replacement = Cached(node)
+        elif isinstance(node, p):
+            replacement = node
+        elif perframe[id(node)]:
+            replacement = PerFrame(node)
+        elif isinstance(node, tuple(transparent)):
+            changed = []
+            def mapping(child):
+                new_child = visit(child)
+                if new_child is not child:
+                    changed.append(child)
+                return new_child
+            replacement = substitute(node, mapping)
+            if not changed:
+                replacement = node
+        else:
+            replacement = node
+        memo[id(node)] = replacement
+        return replacement
+
+    return visit(fn)
+
+def check(fn, ps):
+    """Evaluates *fn* with *ps* directly and by ``Plan(fn)``, and raises
+    ValueError if the results or their dtypes differ.  Returns the 
+    result."""
+
+    direct = numpy.asarray(fn(ps))
+    planned = Plan(fn)(ps)
+    if not numpy.array_equal(direct, numpy.asarray(planned)):
+        raise ValueError('The plan of %r differs from direct evaluation' % fn)
+    if direct.dtype != numpy.asarray(planned).dtype:
+        raise ValueError('The plan of %r yields %s instead of %s' % (fn,
+            numpy.asarray(planned).dtype, direct.dtype))
+    return planned
+
+def benchmark(fn, ps, repeat=None):
+    """Times the direct evaluation of *fn* with *ps* against the evaluation
+    of ``Plan(fn)``.  Returns ``(direct, planned)``, the best times out of
+    *repeat* (default 10) calls each, in seconds."""
+
+    if repeat is None:
+        repeat = 10
+
+    plan = Plan(fn)
+
+    timings = []
+    for function in [fn, plan]:
+        best = None
+        for iteration in xrange(0, repeat):
+            start = time.time()
+            function(ps)
+            duration = time.time() - start
+            if best is None or duration < best:
+                best = duration
+        timings.append(best)
+    return tuple(timings)
@@ -0,0 +1,121 @@
+"""Provides the dtype policy of the rendering pipeline.  The floating point
+dtype to compute in is the parameter ``'dtype'``.  Set it for a scene by::
+
+    scene = Assignment(p('dtype'), numpy.float32) | scene
+
+or by the *dtype* argument of ``Render``.  Without the parameter, numpy's 
+defaults apply."""
+
+import numpy
+from moviemaker3.parameter import p, Ps
+
+__all__ = ['dtypeline', 'asdtype', 'compare_precision', 'check_pipeline']
+
+dtypeline = p('dtype')
+
+def get_dtype(ps):
+    """Returns the dtype demanded by *ps*, or None if there is none."""
+
+    try:
+        dtype = dtypeline(ps)
+    except KeyError:
+        return None
+    if dtype is None:
+        return None
+    return numpy.dtype(dtype)
+
+def asdtype(value, ps):
+    """Returns *value* converted to the dtype demanded by *ps*.  Only
+    floating point ndarrays and floating point scalars are converted, 
+    because they would upcast the results otherwise.  Everything else is
+    returned unchanged, as is *value* if *ps* demands no dtype."""
+
+    dtype = get_dtype(ps)
+    if dtype is None:
+        return value
+    if isinstance(value, numpy.ndarray):
+        if value.dtype.kind == 'f' and value.dtype != dtype:
+            return value.astype(dtype)
+        return value
+    if isinstance(value, (float, numpy.floating)):
+        return dtype.type(value)
+    return value
+
+def compare_precision(fn, ps, dtype=None):
+    """Evaluates *fn* with *ps* once computing in float64 and once computing
+    in *dtype*, which defaults to float32.  Returns ``(deviation, 
+    result_dtype)``, where *deviation* is the maximum absolute difference of
+    the results and *result_dtype* is the dtype of the result computed in
+    *dtype*.  The results can be ndarrays or PIL images."""
+
+    if dtype is None:
+        dtype = numpy.float32
+
+    reference = numpy.asarray(fn(dtypeline.store(ps, numpy.float64)))
+    reduced = numpy.asarray(fn(dtypeline.store(ps, dtype)))
+
+    deviation = numpy.abs(reference.astype(numpy.float64) - 
+        reduced.astype(numpy.float64)).max()
+    return (deviation, reduced.dtype)
+
+def check_pipeline(shape=None, tolerance=None, realtime=None):
+    """Checks the float32 policy against float64 on a sample pipeline: a 
+    ``Mesh`` through ``Cartesian2Polar``, ``Polar2Cartesian``, ``Distance``,
+    ``Angle`` and ``Polynomial`` into a pooled ``AlphaStack``, compiled 
+    into a ``Plan``, and quantised by ``PILext``.  The layers are checked to
+    deviate by at most *tolerance* (default 1e-5) and the 8 bit images by 
+    at most 1, and the results of all nodes to be in the dtype demanded, 
+    if floating point numpy values.  The plan is checked against direct 
+    evaluation.  *shape* (default (120, 160)) is the
+    shape of the mesh, *realtime* (default 1.5) the ``'time/real'``.  
+    Raises AssertionError on failure."""
+
+    # These modules use the policy defined here.
+    from fframework import compound
+    from moviemaker3.mesh import Mesh
+    from moviemaker3.math.angle import Angle
+    from moviemaker3.math.distance import Distance
+    from moviemaker3.math.polar import Cartesian2Polar, Polar2Cartesian
+    from moviemaker3.math.polynomial import Polynomial
+    from moviemaker3.stacks import AlphaStack, shared_pool
+    from moviemaker3.plan import Plan, check
+    from moviemaker3.graph import walk
+    from moviemaker3.ext.PILext import PILext
+
+    if shape is None:
+        shape = (120, 160)
+    if tolerance is None:
+        tolerance = 1e-5
+    if realtime is None:
+        realtime = 1.5
+
+    mesh = Mesh(shape, ylim=(0, 0.7), xlim=(0, 0.7))
+    distance = Distance(Polar2Cartesian(Cartesian2Polar(mesh)))
+    angle = Polynomial([0.0, 0.5], x=Angle(mesh))
+    alpha = Polynomial([0.25, 0.1], x=p('time/real'))
+    scene = AlphaStack(distance, pool=shared_pool())
+    scene ^ compound([alpha, angle])
+    plan = Plan(scene)
+
+    ps = p('time/real').store(Ps(), realtime)
+    for dtype in [numpy.float64, numpy.float32]:
+        check(scene, dtypeline.store(ps, dtype))
+        for node in walk(scene):
+            result = node(dtypeline.store(ps, dtype))
+            if isinstance(result, (numpy.ndarray, numpy.floating)) and \
+                    result.dtype.kind == 'f' and result.dtype != dtype:
+                raise AssertionError('%r computes in %s instead of %s' % 
+                    (node, result.dtype, numpy.dtype(dtype)))
+
+    (deviation, result_dtype) = compare_precision(plan, ps)
+    if deviation > tolerance:
+        raise AssertionError('float32 layers deviate by %g > %g' % 
+            (deviation, tolerance))
+    (deviation, result_dtype) = compare_precision(plan | PILext(), ps)
+    if deviation > 1:
+        raise AssertionError('float32 images deviate by %d levels' % 
+            deviation)
+
+if __name__ == '__main__':
+    check_pipeline()
+    print "The float32 pipeline agrees with float64."
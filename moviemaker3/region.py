@@ -0,0 +1,63 @@
+"""Provides the evaluation of rectangular regions of frames.  The region
+to evaluate is the parameter ``'region'``, a tuple ``(y0, y1, x0, x1)`` of
+pixel indices, where the *y1* and *x1* are exclusive.  Without it, the whole
+frame is evaluated.  Sources of full frame arrays must honour the region;
+``Mesh`` does so, other sources can be wrapped into ``Crop``."""
+
+from fframework import OpFunction, asfunction
+from moviemaker3.parameter import p
+
+__all__ = ['regionline', 'Crop', 'union']
+
+regionline = p('region')
+
+def get_region(ps):
+    """Returns the region demanded by *ps*, or None if there is none."""
+
+    try:
+        return regionline(ps)
+    except KeyError:
+        return None
+
+def union(rectangles, shape):
+    """Returns the bounding box of *rectangles*, a list of regions 
+    ``(y0, y1, x0, x1)``, clipped to the frame of shape ``(shapey, 
+    shapex)``.  Returns None if the bounding box is empty."""
+
+    (shapey, shapex) = shape
+    y0 = max(min([rectangle[0] for rectangle in rectangles] + [shapey]), 0)
+    y1 = min(max([rectangle[1] for rectangle in rectangles] + [0]), shapey)
+    x0 = max(min([rectangle[2] for rectangle in rectangles] + [shapex]), 0)
+    x1 = min(max([rectangle[3] for rectangle in rectangles] + [0]), shapex)
+    if y0 >= y1 or x0 >= x1:
+        return None
+    return (y0, y1, x0, x1)
+
+class Crop(OpFunction):
+    """Crops the full frame arrays of a Function to the region demanded."""
+
+    def __init__(self, fn, yaxis=None):
+        """*fn* returns full frame arrays, with y along axis *yaxis* and x
+        along the following axis.  *yaxis* defaults to -2, matching layers
+        with the colour index in the first dimension."""
+
+        if yaxis is None:
+            yaxis = -2
+
+        self.fn = asfunction(fn)
+        self.yaxis = yaxis
+
+    def __call__(self, ps):
+        """Returns the region of ``.fn(ps)``, or all of it if no region is
+        demanded."""
+
+        result = self.fn(ps)
+        region = get_region(ps)
+        if region is None:
+            return result
+
+        (y0, y1, x0, x1) = region
+        index = [slice(None)] * result.ndim
+        index[self.yaxis] = slice(y0, y1)
+        index[self.yaxis % result.ndim + 1] = slice(x0, x1)
+        return result[tuple(index)]
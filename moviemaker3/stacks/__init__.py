@@ -1,3 +1,5 @@
 from moviemaker3.stacks.additive import *
 from moviemaker3.stacks.alpha import *
 from moviemaker3.stacks.weighted import *
+from moviemaker3.stacks.parallel import *
+from moviemaker3.stacks.over import *
@@ -1,19 +1,31 @@
+import numpy
 from fframework import asfunction
 from moviemaker3.stacks.stack import Stack
+from moviemaker3.precision import asdtype
 
 __all__ = ['AdditiveStack']
 
 class AdditiveStack(Stack):
+    """Adds up the elements on top of the background."""
     
-    def __init__(self, background):
+    def __init__(self, background, pool=None):
+        """*background* is the start value of the sum.  *pool* is handed
+        over to ``Stack``."""
 
-        Stack.__init__(self)
+        Stack.__init__(self, pool=pool)
         self.background = asfunction(background)
 
-    def __call__(self, ps):
-        """Adds up the elements."""
+    def start(self, ps):
+        """Returns the background, in the dtype demanded by *ps*."""
 
-        result = self.background(ps)
-        for layer in self.elements:
-            result = result + layer(ps)
-        return result
+        return asdtype(self.background(ps), ps)
+
+    def combine(self, accumulator, result):
+        """Adds *result*."""
+
+        return accumulator + result
+
+    def combine_batch(self, accumulator, results):
+        """Adds the sum of *results* along the leading axis."""
+
+        return accumulator + numpy.asarray(results).sum(axis=0)
@@ -1,5 +1,7 @@
+import numpy
 from fframework import asfunction
-from moviemaker3.stacks.stack import Stack
+from moviemaker3.stacks.stack import Stack, align_batch
+from moviemaker3.precision import asdtype
 
 __all__ = ['AlphaStack']
 
@@ -14,20 +16,42 @@ class AlphaStack(Stack):
     
     Elements in the AlphaStack should return (*alpha*, *layer*); *layer* and 
     *alpha* are extracted by indexing (tuple assignment).  You might use 
-    ``fframework.compound()`` to generate tuple Functions."""
+    ``fframework.compound()`` to generate tuple Functions.  The result is
+    the result layer, no alpha."""
     
-    def __init__(self, background):
-        """The *background* yields the background layer, no alpha."""
+    def __init__(self, background, pool=None):
+        """The *background* yields the background layer, no alpha.  *pool*
+        is handed over to ``Stack``."""
         
-        Stack.__init__(self)
+        Stack.__init__(self, pool=pool)
         self.background = asfunction(background)
 
-    def __call__(self, ps):
-        """Blends the layers one after the other.  Returns the result 
-        layer, no alpha."""
-        
-        resultlayer = self.background(ps)
-        for layer in self.elements:
-            (alpha, layer) = layer(ps)
-            resultlayer = resultlayer * (1 - alpha) + layer * alpha
-        return resultlayer
+    def start(self, ps):
+        """Returns the background layer, in the dtype demanded by *ps*."""
+
+        return asdtype(self.background(ps), ps)
+
+    def combine(self, accumulator, result):
+        """Blends the (*alpha*, *layer*) *result* over the *accumulator*."""
+
+        (alpha, layer) = result
+        return accumulator * (1 - alpha) + layer * alpha
+
+    def combine_batch(self, accumulator, results):
+        """Blends the (*alphas*, *layers*) *results* over the *accumulator*
+        at once.  The blends are done in the order of the leading axis.
+        Each layer is attenuated by the transmittance of all layers above
+        it."""
+
+        (alphas, layers) = results
+        layers = numpy.asarray(layers)
+        alphas = align_batch(alphas, layers.ndim)
+
+        transmittance = 1 - alphas
+        # transmittance_from[i] is the product over the layers i, i + 1, ...
+        transmittance_from = numpy.cumprod(transmittance[::-1], axis=0)[::-1]
+        transmittance_above = numpy.concatenate([transmittance_from[1:],
+            numpy.ones_like(transmittance_from[:1])])
+
+        return accumulator * transmittance_from[0] + \
+            (layers * alphas * transmittance_above).sum(axis=0)
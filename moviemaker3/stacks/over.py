@@ -0,0 +1,100 @@
+import numpy
+from fframework import OpFunction, asfunction
+from moviemaker3.stacks.stack import Stack, align_batch
+from moviemaker3.precision import asdtype
+
+__all__ = ['OverStack', 'Premultiply', 'premultiply', 'unpremultiply']
+
+def premultiply(alpha, layer):
+    """Returns the premultiplied RGBA layer for straight *alpha* and 
+    *layer*.  The colour index is in the first dimension of *layer*, or 
+    *layer* is grayscale.  The premultiplied layer holds the colour
+    channels multiplied by *alpha*, followed by *alpha*, in the first 
+    dimension."""
+
+    colour = numpy.asarray(layer * alpha)
+    if colour.ndim == 2:
+        colour = colour[numpy.newaxis]
+    alpha = numpy.broadcast_to(alpha, colour.shape[1:]).astype(colour.dtype)
+    return numpy.concatenate([colour, alpha[numpy.newaxis]])
+
+def unpremultiply(rgba):
+    """Returns (*alpha*, *layer*) with straight colours for the 
+    premultiplied RGBA layer *rgba*.  Where *alpha* is zero, *layer* is
+    zero."""
+
+    alpha = rgba[-1]
+    colour = rgba[:-1]
+    layer = numpy.zeros_like(colour)
+    numpy.divide(colour, alpha, out=layer, where=(alpha > 0))
+    return (alpha, layer)
+
+class Premultiply(OpFunction):
+    """Turns the (*alpha*, *layer*) results of a Function, as used in the
+    ``AlphaStack``, into premultiplied RGBA layers."""
+
+    def __init__(self, fn):
+        """*fn* returns (*alpha*, *layer*) with straight colours."""
+
+        self.fn = asfunction(fn)
+
+    def __call__(self, ps):
+        """Returns the premultiplied RGBA layer."""
+
+        (alpha, layer) = self.fn(ps)
+        return premultiply(alpha, layer)
+
+class OverStack(Stack):
+    r"""Composites premultiplied RGBA layers with the over operator.  The 
+    formula used for combination of layer `i` using layer `i + 1` is:
+
+    .. math::
+
+        X = X_{i + 1} + X_i (1 - \alpha_{i + 1})
+
+    for all channels including alpha, where `X` is a premultiplied RGBA 
+    layer, see ``premultiply()``.  The result is a premultiplied RGBA layer
+    again, so ``OverStack`` instances can be nested as layers."""
+
+    def __init__(self, background=None, pool=None):
+        """*background* yields the premultiplied RGBA background layer, it
+        defaults to 0, full transparency.  *pool* is handed over to 
+        ``Stack``."""
+
+        if background is None:
+            background = 0
+
+        Stack.__init__(self, pool=pool)
+        self.background = asfunction(background)
+
+    def start(self, ps):
+        """Returns the background layer, in the dtype demanded by *ps*."""
+
+        return asdtype(self.background(ps), ps)
+
+    def combine(self, accumulator, result):
+        """Composites the premultiplied RGBA layer *result* over the 
+        *accumulator*."""
+
+        blended = accumulator * (1 - result[-1])
+        if blended.shape == result.shape:
+            blended += result
+            return blended
+        return blended + result
+
+    def combine_batch(self, accumulator, results):
+        """Composites the premultiplied RGBA *results* over the 
+        *accumulator* at once.  The blends are done in the order of the
+        leading axis."""
+
+        results = numpy.asarray(results)
+        alphas = align_batch(results[:, -1], results.ndim)
+
+        transmittance = 1 - alphas
+        # transmittance_from[i] is the product over the layers i, i + 1, ...
+        transmittance_from = numpy.cumprod(transmittance[::-1], axis=0)[::-1]
+        transmittance_above = numpy.concatenate([transmittance_from[1:],
+            numpy.ones_like(transmittance_from[:1])])
+
+        return accumulator * transmittance_from[0] + \
+            (results * transmittance_above).sum(axis=0)
@@ -0,0 +1,50 @@
+"""Provides concurrent evaluation of stack elements in a thread pool.  Large
+numpy operations release the GIL, so independent layers can use several
+cores."""
+
+import threading
+import multiprocessing
+import multiprocessing.pool
+
+__all__ = ['shared_pool']
+
+_shared_pool = None
+_shared_pool_lock = threading.Lock()
+_local = threading.local()
+
+def shared_pool(nthreads=None):
+    """Returns the thread pool shared by all stacks.  It is created on the
+    first call, with *nthreads* threads, defaulting to the number of CPUs.
+    *nthreads* is ignored on later calls."""
+
+    global _shared_pool
+
+    with _shared_pool_lock:
+        if _shared_pool is None:
+            if nthreads is None:
+                nthreads = multiprocessing.cpu_count()
+            _shared_pool = multiprocessing.pool.ThreadPool(nthreads)
+        return _shared_pool
+
+def in_pool():
+    """Tells if the calling thread is evaluating an element in a pool.
+    Nested stacks evaluate serially then, because waiting for other tasks
+    in a pool thread can deadlock the pool."""
+
+    return getattr(_local, 'active', False)
+
+def pooled(fn, *args, **kwargs):
+    """Calls *fn* with *args* and *kwargs*, marking the calling thread as a
+    pool thread meanwhile.  Returns the result."""
+
+    _local.active = True
+    try:
+        return fn(*args, **kwargs)
+    finally:
+        _local.active = False
+
+def evaluate(layer, ps):
+    """Evaluates *layer* with *ps*, marking the calling thread as a pool
+    thread meanwhile."""
+
+    return pooled(layer, ps)
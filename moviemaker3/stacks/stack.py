@@ -1,14 +1,35 @@
+import numpy
 from fframework import OpFunction, asfunction
+from moviemaker3.stacks.parallel import in_pool, evaluate
 
 __all__ = ['Stack']
 
+def align_batch(batch, ndim):
+    """Inserts singleton axes after the leading (batch) axis of *batch* until
+    it has *ndim* dimensions.  This reproduces for batches the broadcasting
+    of single element results, which aligns the trailing axes."""
+
+    batch = numpy.asarray(batch)
+    missing = ndim - batch.ndim
+    if missing <= 0:
+        return batch
+    return batch.reshape(batch.shape[:1] + (1,) * missing + batch.shape[1:])
+
 class Stack(OpFunction):
-    """Base class for stacks with layers.  Stacks can be used as layers."""
+    """Base class for stacks with layers.  Stacks can be used as layers.
+
+    Derived classes define the combination of the layers by overloading
+    ``.start()``, ``.combine()``, ``.combine_batch()`` and ``.finish()``."""
     
-    def __init__(self):
-        """Initialises the ``.elements`` attribute to the empty list."""
+    def __init__(self, pool=None):
+        """Initialises the ``.elements`` attribute to the empty list.
+
+        If *pool* is given, the elements are evaluated concurrently in 
+        *pool*, a ``multiprocessing.pool.ThreadPool`` like the one returned
+        by ``shared_pool()``."""
 
         self.elements = []
+        self.pool = pool
     
     def __xor__(self, other):
         """Stack *other* onto *self*.  Acts in-place!  This is done so that
@@ -54,3 +75,54 @@ class Stack(OpFunction):
         nothing."""
 
         del self.elements[key]
+
+    def start(self, ps):
+        """Returns the accumulator before any element has been combined,
+        evaluated with *ps*.  To be overloaded."""
+
+        raise NotImplementedError('Derived classes must overload .start()')
+
+    def combine(self, accumulator, result):
+        """Combines the *result* of one element with the *accumulator*.
+        Returns the new accumulator.  To be overloaded."""
+
+        raise NotImplementedError('Derived classes must overload .combine()')
+
+    def combine_batch(self, accumulator, results):
+        """Like ``.combine()``, but *results* holds the results of several
+        elements stacked along a new leading axis, in stack order.  To be
+        overloaded."""
+
+        raise NotImplementedError(
+            'Derived classes must overload .combine_batch()')
+
+    def finish(self, accumulator):
+        """Turns the *accumulator* into the result of the stack.  Returns the
+        *accumulator* unchanged by default."""
+
+        return accumulator
+
+    def __call__(self, ps):
+        """Combines the elements, evaluated with *ps*, in stack order.
+
+        With a ``.pool``, the elements are evaluated concurrently.  The
+        results are combined in the calling thread, in stack order as they
+        become ready, so that the result does not depend on the timing of 
+        the threads.  Inside of a pool thread, the elements are evaluated 
+        serially."""
+
+        if self.pool is None or in_pool():
+            accumulator = self.start(ps)
+            for layer in self.elements:
+                accumulator = self.combine(accumulator, layer(ps))
+            return self.finish(accumulator)
+
+        results = [self.pool.apply_async(evaluate, (layer, ps))
+            for layer in self.elements]
+        results = (pending.get() for pending in results)
+
+        # The start value is computed while the pool works on the elements.
+        accumulator = self.start(ps)
+        for result in results:
+            accumulator = self.combine(accumulator, result)
+        return self.finish(accumulator)
@@ -1,39 +1,64 @@
+import numpy
 from fframework import asfunction
-from moviemaker3.stacks.stack import Stack
+from moviemaker3.stacks.stack import Stack, align_batch
+from moviemaker3.precision import asdtype
 
 class WeightedStack(Stack):
     """Elements in the WeightedStack should return (*weight*, *layer*); 
     *layer* and *weight* are extracted by indexing (tuple assignment).  You 
-    might use ``fframework.compound()`` to generate tuple Functions."""
+    might use ``fframework.compound()`` to generate tuple Functions.
+
+    Note that if all weights are zero, the result is undefined."""
     
-    def __init__(self, zero_layer=None, zero_weight=None):
+    def __init__(self, zero_layer=None, zero_weight=None, pool=None):
         """*zero_layer* is the 0 to use in summing up the layers (the start 
         value), it defaults to 0.
         
         *zero_weight* is the 0 to use in summing up the weights, it default to
-        0, too."""
+        0, too.  Both are evaluated with the parameters of the call.
+
+        *pool* is handed over to ``Stack``."""
 
         if zero_layer is None:
             zero_layer = 0
         if zero_weight is None:
             zero_weight = 0
 
-        Stack.__init__(self)
+        Stack.__init__(self, pool=pool)
         self.zero_layer = asfunction(zero_layer)
         self.zero_weight = asfunction(zero_weight)
 
-    def __call__(self, ps):
-        """Blends the layers together.  Note that if all weights are zero,
-        the result is undefined.  The start value for summing up the layers
-        is *self.zero_layer*.  The start value for summing up the weights is
-        *self.zero_weight*.  Both are evaluated with *ps*."""
-        
-        sumlayer = self.zero_layer(ps)
-        weightsum = self.zero_weight(ps)
-        for layer in self.elements:
-            (weight, layer) = layer(ps)
-            # We don't use augmented arithmetics because we might want to
-            # employ broadcasting.
-            sumlayer = sumlayer + weight * layer
-            weightsum = weight + weightsum
+    def start(self, ps):
+        """Returns (*sumlayer*, *weightsum*), starting from *self.zero_layer* 
+        and *self.zero_weight* in the dtype demanded by *ps*."""
+
+        return (asdtype(self.zero_layer(ps), ps), 
+            asdtype(self.zero_weight(ps), ps))
+
+    def combine(self, accumulator, result):
+        """Adds the weighted layer and the weight of the (*weight*, *layer*)
+        *result*."""
+
+        (sumlayer, weightsum) = accumulator
+        (weight, layer) = result
+        # We don't use augmented arithmetics because we might want to
+        # employ broadcasting.
+        return (sumlayer + weight * layer, weight + weightsum)
+
+    def combine_batch(self, accumulator, results):
+        """Adds the weighted layers and the weights of the (*weights*, 
+        *layers*) *results* summed along the leading axis."""
+
+        (sumlayer, weightsum) = accumulator
+        (weights, layers) = results
+        weights = numpy.asarray(weights)
+        layers = numpy.asarray(layers)
+        aligned = align_batch(weights, layers.ndim)
+        return (sumlayer + (aligned * layers).sum(axis=0),
+            weightsum + weights.sum(axis=0))
+
+    def finish(self, accumulator):
+        """Divides the summed layers by the summed weights."""
+
+        (sumlayer, weightsum) = accumulator
         return sumlayer / weightsum
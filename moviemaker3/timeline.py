@@ -0,0 +1,139 @@
+"""Provides the evaluation of scalar animation parameters for a whole 
+timeline at once."""
+
+import logging
+import numpy
+from fframework import OpFunction, Constant
+from moviemaker3.parameter import p, Ps
+from moviemaker3.assignment import Assignment
+from moviemaker3.precision import dtypeline
+from moviemaker3.graph import children, walk, rewrite
+
+__all__ = ['Tabulated', 'tabulate']
+
+logger = logging.getLogger('mm3.timeline')
+
+frametimeline = p('time/frame')
+realtimeline = p('time/real')
+
+class Tabulated(OpFunction):
+    """Looks up the values of a Function, which have been evaluated 
+    beforehand for a number of times."""
+
+    def __init__(self, fn, table, keys):
+        """*table* holds the values of *fn* at the times given by *keys*, a
+        list of ``(frametime, realtime)``.  At other times, *fn* is 
+        called."""
+
+        self.fn = fn
+        self.table = table
+        self.indices = dict([(key, index) for (index, key) in 
+            enumerate(keys)])
+
+    def __call__(self, ps):
+        """Returns the tabulated value for the time in *ps*."""
+
+        key = (frametimeline(ps), realtimeline(ps))
+        index = self.indices.get(key)
+        if index is None:
+            return self.fn(ps)
+        return self.table[index]
+
+def _parameters(fn):
+    """Returns a dict mapping the ids of the Functions in the graph of *fn*
+    to the set of the names of the ``p`` objects below them."""
+
+    names = {}
+    for node in walk(fn):
+        if isinstance(node, p):
+            own = set([node.name])
+        else:
+            own = set()
+        for child in children(node):
+            own.update(names[id(child)])
+        names[id(node)] = own
+    return names
+
+def _times(ps, frametime, realtime):
+    """Returns *ps* extended by the times."""
+
+    ps = frametimeline.store(ps, frametime)
+    return realtimeline.store(ps, realtime)
+
+def _table(fn, frametimes, realtimes, ps):
+    """Returns the values of *fn* at all times as an ndarray, or None if *fn*
+    is not scalar-valued or cannot be evaluated with arrays of times."""
+
+    samples = sorted(set([0, len(frametimes) // 2, len(frametimes) - 1]))
+    try:
+        values = [fn(_times(ps, frametimes[index], realtimes[index]))
+            for index in samples]
+        if numpy.ndim(values[0]) != 0 or \
+                numpy.asarray(values[0]).dtype.kind not in 'biufc':
+            return None
+        table = numpy.asarray(fn(_times(ps, numpy.asarray(frametimes),
+            numpy.asarray(realtimes))))
+    except Exception:
+        logger.debug('Cannot tabulate %r' % fn, exc_info=True)
+        return None
+
+    if table.shape != (len(frametimes),):
+        return None
+    for (index, value) in zip(samples, values):
+        if not numpy.allclose(table[index], value):
+            return None
+    return table
+
+def tabulate(fn, frametimes, framerate, dtype=None, realtimes=None):
+    """Returns the graph of *fn* with its scalar-valued subgraphs depending
+    only on the times replaced by ``Tabulated`` Functions.  Each of them is
+    evaluated once for all *frametimes* at *framerate*, by storing the times
+    as ndarrays, and checked against the evaluation at single times.
+    *dtype* is stored as the ``'dtype'`` parameter if not None.  If 
+    *realtimes* is given, it holds the real time for each item of 
+    *frametimes*, which may then repeat, e.g. for subframes.
+
+    Subgraphs qualify if all their ``p`` objects access ``'time/...'``
+    parameters.  The Functions are assumed to depend on nothing else than
+    their parameters.  If an ``Assignment`` in the graph stores some
+    ``'time/...'`` parameter, *fn* is returned unchanged."""
+
+    frametimes = list(frametimes)
+    if len(frametimes) == 0:
+        return fn
+    if realtimes is None:
+        realtimes = [float(frametime) / framerate 
+            for frametime in frametimes]
+    realtimes = list(realtimes)
+    keys = zip(frametimes, realtimes)
+
+    ps = Ps()
+    if dtype is not None:
+        ps = dtypeline.store(ps, dtype)
+
+    for node in walk(fn):
+        if isinstance(node, Assignment) and isinstance(node.p, p) and \
+                node.p.name.startswith('time/'):
+            return fn
+
+    names = _parameters(fn)
+    replacements = {}
+    visited = set()
+
+    def visit(node):
+        if id(node) in visited:
+            return
+        visited.add(id(node))
+        own = names[id(node)]
+        if not isinstance(node, (Constant, p)) and len(own) > 0 and \
+                all([name.startswith('time/') for name in own]):
+            table = _table(node, frametimes, realtimes, ps)
+            if table is not None:
+                replacements[id(node)] = Tabulated(node, table, keys)
+                return
+        for child in children(node):
+            visit(child)
+
+    visit(fn)
+    logger.info('Tabulated %d subgraphs' % len(replacements))
+    return rewrite(fn, lambda node: replacements.get(id(node)))